@@ -1,32 +1,8 @@
 import numpy as np
-from scipy.optimize import curve_fit
 from attrs import define, field
 import matplotlib.pyplot as plt
 
-@define(eq=False)
-class ExcitationModel:
-    """Base class for excitation models."""
-    pass
-
-@define(eq=False)
-class LightExcitation(ExcitationModel):
-    """Models light-dependent excitation using a Hill function"""
-    
-    A: float = field(init=False)
-    Kd: float = field(init=False)
-    n: float = field(init=False)
-    baseline: float = field(default=0.0, init=False)  # Adding baseline field with default value
-    
-    def hill_function(self, Irr_pre, A, Kd, n, baseline):
-        return baseline + A * (Irr_pre ** n) / ((Kd ** n) + (Irr_pre ** n))
-
-    def fit_excitation(self, light_intensities, responses):
-        # Fit Hill function to the light intensity vs response data
-        popt, _ = curve_fit(self.hill_function, light_intensities, responses, maxfev=10000, p0=[1.0, 1.0, 1.0, 0.0])
-        self.A, self.Kd, self.n, self.baseline = popt
-
-    def __call__(self, Irr_pre):
-        return self.hill_function(Irr_pre, self.A, self.Kd, self.n, self.baseline)
+from light_dependence import LightExcitation
 
 @define(eq=False)
 class GECI:
@@ -0,0 +1,318 @@
+"""Asynchronous closed-loop readout of GECI sensors.
+
+With synchronous readout the simulation stalls while the controller
+processes each ΔF/F sample. Here the simulation thread only samples
+(``GECI.get_state()`` plus optional noise and spike inference) and publishes a
+:class:`Frame` into a :class:`FrameQueue`. An asyncio consumer takes frames
+from the queue and makes decisions while the simulation keeps advancing.
+
+The queue is a bounded ``deque`` with a drop policy:
+
+``"drop_oldest"``
+    A full queue discards its oldest frame. With ``latest=True`` consumers
+    always act on the newest frame, which bounds sample-to-decision latency.
+``"drop_newest"``
+    A full queue rejects the new frame.
+``"block"``
+    The simulation waits for space. No frames are lost, but the simulation
+    is synchronous with a slow consumer again.
+
+:func:`run_closed_loop` consumes with ``latest=True`` under the two drop
+policies and with ``latest=False`` under ``"block"``, so every published
+frame reaches ``decide`` there. Passing ``latest=True`` with ``"block"``
+skips stale frames again, and they count as dropped.
+
+Each frame carries its ``perf_counter`` sample time, and
+:class:`LatencyTracker` records when it was received and when its decision
+finished, so sample-to-decision latency can be checked against the imaging
+frame period. Typical use with Brian2/cleo::
+
+    queue = FrameQueue(maxsize=2)
+    readout = AsyncReadout.from_geci(geci, queue)
+    net.add(readout.network_operation(frame_period_ms=1000 / 30))
+    tracker = asyncio.run(
+        run_closed_loop(lambda: net.run(10 * second), decide, queue, 1000 / 30)
+    )
+    print(tracker.summary(queue))
+
+``decide`` runs on the event loop thread; anything it sets for the
+simulation to read (e.g. a light source's power) should be a single
+attribute assignment, which is atomic.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import inspect
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+import numpy as np
+from attrs import define, field, frozen
+from attrs.validators import in_
+
+DROP_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+@frozen(eq=False)
+class Frame:
+    """One imaging frame of sensor readout"""
+
+    index: int
+    t_ms: float
+    """simulation time of the sample (ms)"""
+    dff: np.ndarray
+    """noise-free ΔF/F per neuron"""
+    dff_noisy: np.ndarray | None = None
+    """ΔF/F with the sensor's measurement noise, if requested"""
+    spikes: np.ndarray | None = None
+    """output of the spike-inference function, if one was given"""
+    t_sampled: float = 0.0
+    """wall-clock ``time.perf_counter()`` when the sample was taken (s)"""
+
+
+@define(eq=False)
+class FrameQueue:
+    """Bounded frame queue from the simulation thread to asyncio consumers"""
+
+    maxsize: int = 2
+    policy: str = field(default="drop_oldest", validator=in_(DROP_POLICIES))
+    published: int = field(default=0, init=False)
+    dropped: int = field(default=0, init=False)
+    """frames discarded by the drop policy or skipped by ``get(latest=True)``"""
+    closed: bool = field(default=False, init=False)
+    _frames: deque = field(init=False, repr=False)
+    _not_full: threading.Condition = field(factory=threading.Condition, init=False, repr=False)  # fmt: skip
+    _loop: asyncio.AbstractEventLoop | None = field(default=None, init=False, repr=False)  # fmt: skip
+    _ready: asyncio.Event | None = field(default=None, init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        maxlen = self.maxsize if self.policy == "drop_oldest" else None
+        self._frames = deque(maxlen=maxlen)
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Attaches the event loop consumers will ``await`` :meth:`get` on"""
+        self._loop = loop
+        self._ready = asyncio.Event()
+
+    def _wake(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._ready.set)
+
+    def put(self, frame: Frame) -> bool:
+        """Publishes a frame from any thread; returns False if it was rejected.
+
+        Under ``"block"`` that happens if the queue is closed while waiting.
+        """
+        if self.closed:
+            raise RuntimeError("FrameQueue is closed")
+        # the counters are updated from both threads, so only under the lock
+        with self._not_full:
+            if len(self._frames) >= self.maxsize:
+                if self.policy == "drop_newest":
+                    self.dropped += 1
+                    return False
+                elif self.policy == "drop_oldest":
+                    self.dropped += 1  # the deque's maxlen discards it on append
+                else:
+                    self._not_full.wait_for(
+                        lambda: len(self._frames) < self.maxsize or self.closed
+                    )
+                    if self.closed:  # no consumer will take it
+                        return False
+            self._frames.append(frame)
+            self.published += 1
+        self._wake()
+        return True
+
+    def _pop(self, latest: bool) -> Frame | None:
+        with self._not_full:
+            if not self._frames:
+                return None
+            frame = self._frames.popleft()
+            while latest and self._frames:
+                frame = self._frames.popleft()
+                self.dropped += 1
+            self._not_full.notify()
+        return frame
+
+    async def get(self, latest: bool = False) -> Frame | None:
+        """Next frame (or the newest, skipping older ones, if ``latest``);
+        None once the queue is closed and empty"""
+        if self._ready is None:
+            self.bind(asyncio.get_running_loop())
+        while True:
+            frame = self._pop(latest)
+            if frame is not None or self.closed:
+                return frame
+            self._ready.clear()
+            # a frame may have arrived between the pop and the clear
+            frame = self._pop(latest)
+            if frame is not None:
+                return frame
+            await self._ready.wait()
+
+    def close(self) -> None:
+        """Signals consumers that no more frames will come"""
+        self.closed = True
+        with self._not_full:
+            self._not_full.notify_all()
+        self._wake()
+
+
+@define(eq=False)
+class ThresholdSpikeInference:
+    """Flags neurons whose ΔF/F rose by more than ``k`` noise SDs since the last frame"""
+
+    sigma_noise: float
+    k: float = 3.0
+    _previous: np.ndarray | None = field(default=None, init=False, repr=False)
+
+    def __call__(self, dff: np.ndarray) -> np.ndarray:
+        previous = self._previous if self._previous is not None else dff
+        self._previous = dff
+        return dff - previous > self.k * np.sqrt(2) * self.sigma_noise
+
+
+@define(eq=False)
+class AsyncReadout:
+    """Samples sensor ΔF/F and publishes frames without waiting on consumers"""
+
+    queue: FrameQueue
+    read_dff: Callable[[], np.ndarray]
+    """returns the current ΔF/F of every neuron"""
+    sigma_noise: float = 0.0
+    """standard deviation of the noise added to ``dff_noisy``; 0 for none"""
+    spike_inference: Callable[[np.ndarray], np.ndarray] | None = None
+    """called on each frame's (noisy, if available) ΔF/F"""
+    rng: np.random.Generator = field(default=None, converter=np.random.default_rng)
+    n_frames: int = field(default=0, init=False)
+
+    @classmethod
+    def from_geci(cls, geci, queue: FrameQueue, noise: bool = True, **kwargs):
+        """Reads all neuron groups of a ``GECI``, using its ``sigma_noise``"""
+
+        def read_dff():
+            return np.concatenate([np.asarray(v) for v in geci.get_state().values()])
+
+        if noise:
+            kwargs.setdefault("sigma_noise", geci.sigma_noise)
+        return cls(queue, read_dff, **kwargs)
+
+    def sample(self, t_ms: float) -> Frame:
+        """Takes and publishes one frame; called from the simulation thread"""
+        t_sampled = time.perf_counter()
+        dff = np.array(self.read_dff(), dtype=float)  # the simulation keeps mutating it
+        dff.flags.writeable = False
+        dff_noisy = None
+        if self.sigma_noise:
+            dff_noisy = dff + self.sigma_noise * self.rng.standard_normal(dff.shape)
+            dff_noisy.flags.writeable = False
+        spikes = None
+        if self.spike_inference is not None:
+            spikes = self.spike_inference(dff if dff_noisy is None else dff_noisy)
+        frame = Frame(self.n_frames, t_ms, dff, dff_noisy, spikes, t_sampled)
+        self.n_frames += 1
+        self.queue.put(frame)
+        return frame
+
+    def network_operation(self, frame_period_ms: float):
+        """Brian2 ``NetworkOperation`` sampling once per imaging frame"""
+        from brian2 import NetworkOperation, ms
+
+        return NetworkOperation(
+            lambda t: self.sample(float(t / ms)), dt=frame_period_ms * ms
+        )
+
+
+@define(eq=False)
+class LatencyTracker:
+    """Per-frame wall-clock latencies of a closed loop"""
+
+    budget_ms: float
+    """latency budget, normally one imaging frame period"""
+    frame_index: list[int] = field(factory=list)
+    sample_to_receive_ms: list[float] = field(factory=list)
+    sample_to_decision_ms: list[float] = field(factory=list)
+
+    def record(self, frame: Frame, t_received: float, t_decided: float) -> None:
+        self.frame_index.append(frame.index)
+        self.sample_to_receive_ms.append((t_received - frame.t_sampled) * 1e3)
+        self.sample_to_decision_ms.append((t_decided - frame.t_sampled) * 1e3)
+
+    def summary(self, queue: FrameQueue | None = None) -> dict:
+        """Latency percentiles (ms) and the fraction of decisions over budget"""
+        latency = np.asarray(self.sample_to_decision_ms)
+        out = {"n_decisions": len(latency), "budget_ms": self.budget_ms}
+        if len(latency):
+            p50, p95, p99 = np.percentile(latency, [50, 95, 99]).tolist()
+            out.update(
+                p50_ms=p50,
+                p95_ms=p95,
+                p99_ms=p99,
+                max_ms=float(latency.max()),
+                queue_p50_ms=float(np.median(self.sample_to_receive_ms)),
+                over_budget=float(np.mean(latency > self.budget_ms)),
+            )
+        if queue is not None:
+            out.update(published=queue.published, dropped=queue.dropped)
+        return out
+
+
+async def run_closed_loop(
+    simulate: Callable[[], object],
+    decide: Callable[[Frame], object],
+    queue: FrameQueue,
+    budget_ms: float,
+    latest: bool | None = None,
+) -> LatencyTracker:
+    """Runs ``simulate`` in a worker thread while ``decide`` consumes its frames.
+
+    Parameters
+    ----------
+    simulate : Callable[[], object]
+        Blocking simulation run that publishes into ``queue`` (e.g. through
+        :meth:`AsyncReadout.network_operation`).
+    decide : Callable[[Frame], object]
+        Decision function, plain or ``async``.
+    queue : FrameQueue
+    budget_ms : float
+        Latency budget recorded in the returned tracker, normally the
+        imaging frame period.
+    latest : bool, optional
+        Act on only the newest available frame. By default True, except
+        under the ``"block"`` policy, whose frames are all consumed.
+
+    Returns
+    -------
+    LatencyTracker
+    """
+    if latest is None:
+        latest = queue.policy != "block"
+    queue.bind(asyncio.get_running_loop())
+    tracker = LatencyTracker(budget_ms)
+
+    async def consume():
+        while (frame := await queue.get(latest)) is not None:
+            t_received = time.perf_counter()
+            result = decide(frame)
+            if inspect.isawaitable(result):
+                await result
+            tracker.record(frame, t_received, time.perf_counter())
+
+    consumer = asyncio.create_task(consume())
+    consumer.add_done_callback(lambda _: queue.close())  # stop publishing if it fails
+    try:
+        await asyncio.to_thread(simulate)
+    except RuntimeError:
+        if not consumer.done():
+            raise
+    finally:
+        queue.close()
+    await consumer  # re-raises the consumer's error, if any
+    return tracker
@@ -0,0 +1,321 @@
+"""Batch calibration and irradiance inference across many recording sessions.
+
+Replaces copy-pasting arrays into ``updated irrdiance finder.py`` and friends.
+Each session is described by one row of a manifest (CSV, Parquet or npz) with
+at least a ``session`` and a ``path`` column. ``path`` points to a per-session
+``.npz`` or ``.csv`` file with these arrays (columns, for CSV):
+
+- ``deltaF_over_delta``, ``physiological_response``: calibration data
+  (required), fit with the quadratic model of the scripts
+- ``peaks``: measured ΔF/F0 peaks to convert to irradiance (optional)
+- ``light_intensities``, ``responses``: data for the Hill light-dependence
+  fit of ``Fitted Light Dependent Curves Updated.py`` (optional)
+
+Usage::
+
+    python batch_calibration.py manifest.csv results.csv --jobs 8
+
+Finished sessions are recorded in ``<output>.parts/`` and skipped when the
+same command is run again, so an interrupted run can simply be restarted.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+import instrumentation
+from irradiance_uncertainty import (
+    fit_calibration,
+    infer_light_intensity_with_uncertainty,
+)
+from light_dependence import LightExcitation
+
+STAGES = ("load", "calibration", "light_dependence", "inversion")
+
+
+def _read_table(path: Path, str_columns=()) -> dict[str, np.ndarray]:
+    """Reads a CSV, Parquet or npz file into a {column: array} dict.
+
+    CSV columns are parsed as floats where possible, except ``str_columns``,
+    which are always kept as the strings in the file.
+    """
+    suffix = path.suffix.lower()
+    if suffix == ".npz":
+        with np.load(path, allow_pickle=False) as data:
+            return {k: data[k] for k in data.files}
+    elif suffix == ".csv":
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        columns = {}
+        for key in rows[0].keys() if rows else []:
+            values = [row[key] for row in rows if row[key] not in ("", None)]
+            if key in str_columns:
+                columns[key] = np.array(values, dtype=str)
+                continue
+            try:
+                columns[key] = np.array(values, dtype=float)
+            except ValueError:
+                columns[key] = np.array(values, dtype=str)
+        return columns
+    elif suffix in (".parquet", ".pq"):
+        try:
+            import pandas as pd
+        except ImportError as e:
+            raise ImportError("reading Parquet manifests requires pandas") from e
+        df = pd.read_parquet(path)
+        return {k: df[k].dropna().to_numpy() for k in df.columns}
+    raise ValueError(f"unsupported file type {suffix} for {path}")
+
+
+def read_manifest(path: str | os.PathLike) -> list[dict[str, str]]:
+    """Returns one ``{"session": ..., "path": ...}`` dict per manifest row.
+
+    Relative data paths are resolved against the manifest's directory.
+    """
+    path = Path(path)
+    table = _read_table(path, str_columns=("session", "path"))
+    for col in ("session", "path"):
+        if col not in table:
+            raise ValueError(f"manifest {path} is missing the '{col}' column")
+    sessions = []
+    for session, data_path in zip(table["session"], table["path"]):
+        data_path = Path(str(data_path))
+        if not data_path.is_absolute():
+            data_path = path.parent / data_path
+        sessions.append({"session": str(session), "path": str(data_path)})
+    names = [s["session"] for s in sessions]
+    if len(set(names)) != len(names):
+        raise ValueError(f"manifest {path} has duplicate session names")
+    return sessions
+
+
+def _median_of_finite(values: np.ndarray) -> float:
+    """Median ignoring NaN; NaN, without a warning, if nothing is left"""
+    values = values[~np.isnan(values)]
+    return float(np.median(values)) if values.size else np.nan
+
+
+def process_session(
+    session: str, path: str, method: str = "delta", n_samples: int = 1000
+) -> tuple[dict, dict[str, np.ndarray]]:
+    """Runs fitting and inversion for one session.
+
+    Returns
+    -------
+    tuple[dict, dict[str, np.ndarray]]
+        The session's row of the results table (fit parameters, summary
+        statistics and ``t_<stage>`` timings in seconds), and per-peak
+        irradiance arrays (empty if the session has no ``peaks``).
+    """
+    row = {"session": session, "path": path}
+    timings = {}
+
+    t0 = time.perf_counter()
+    data = _read_table(Path(path))
+    timings["load"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    popt, pcov = fit_calibration(
+        data["deltaF_over_delta"], data["physiological_response"]
+    )
+    timings["calibration"] = time.perf_counter() - t0
+    perr = np.sqrt(np.diag(pcov))
+    for name, value, err in zip("abc", popt, perr):
+        row[f"calib_{name}"] = value
+        row[f"calib_{name}_std"] = err
+
+    if "light_intensities" in data and "responses" in data:
+        t0 = time.perf_counter()
+        exc_model = LightExcitation()
+        exc_model.fit_excitation(data["light_intensities"], data["responses"])
+        timings["light_dependence"] = time.perf_counter() - t0
+        for name in ("A", "Kd", "n", "baseline"):
+            row[f"hill_{name}"] = getattr(exc_model, name)
+
+    arrays = {}
+    if "peaks" in data:
+        t0 = time.perf_counter()
+        est = infer_light_intensity_with_uncertainty(
+            data["peaks"], popt, pcov, method=method, n_samples=n_samples
+        )
+        timings["inversion"] = time.perf_counter() - t0
+        arrays = {
+            "peaks": data["peaks"],
+            "irradiance": est.value,
+            "irradiance_std": est.std,
+            "irradiance_lower": est.lower,
+            "irradiance_upper": est.upper,
+        }
+        row["n_peaks"] = est.value.size
+        row["n_peaks_invalid"] = int(np.isnan(est.value).sum())
+        row["irradiance_median"] = _median_of_finite(est.value)
+        row["irradiance_std_median"] = _median_of_finite(est.std)
+
+    for stage in STAGES:
+        row[f"t_{stage}"] = timings.get(stage, np.nan)
+    return row, arrays
+
+
+def _part_name(session: str) -> str:
+    """File-system-safe part file stem, unique per session name"""
+    safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in session)
+    # sanitizing can map different names to the same stem (``a/b``, ``a_b``)
+    digest = hashlib.blake2b(session.encode(), digest_size=4).hexdigest()
+    return f"{safe}-{digest}"
+
+
+def _run_and_save(session, path, parts_dir, method, n_samples):
+    """Worker entry point: processes a session and writes its part files."""
+    t0 = time.perf_counter()
+    try:
+        row, arrays = process_session(session, path, method, n_samples)
+        row["status"] = "ok"
+    except Exception:
+        row, arrays = {"session": session, "path": path}, {}
+        row["status"] = "error"
+        row["error"] = traceback.format_exc(limit=3)
+    row["t_total"] = time.perf_counter() - t0
+    row = {k: (v.item() if isinstance(v, np.generic) else v) for k, v in row.items()}
+
+    stem = parts_dir / _part_name(session)
+    if arrays:
+        np.savez(stem.with_suffix(".npz"), **arrays)
+    # json last: its presence marks the session as finished
+    tmp = stem.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(row))
+    tmp.replace(stem.with_suffix(".json"))
+    return row
+
+
+def _write_results(rows: list[dict], output: Path) -> None:
+    columns = []
+    for row in rows:
+        columns += [k for k in row if k not in columns]
+    if output.suffix.lower() in (".parquet", ".pq"):
+        import pandas as pd
+
+        pd.DataFrame(rows, columns=columns).to_parquet(output)
+    else:
+        with open(output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def run_batch(
+    manifest: str | os.PathLike,
+    output: str | os.PathLike,
+    jobs: int = 1,
+    method: str = "delta",
+    n_samples: int = 1000,
+    retry_failed: bool = False,
+) -> list[dict]:
+    """Processes every session in ``manifest`` and writes one results table.
+
+    Parameters
+    ----------
+    manifest : str | os.PathLike
+        CSV, Parquet or npz manifest; see the module docstring.
+    output : str | os.PathLike
+        Results table, written as Parquet if the suffix is ``.parquet``,
+        otherwise as CSV.
+    jobs : int, optional
+        Number of worker processes, by default 1 (run in this process).
+    method : str, optional
+        Uncertainty propagation method for the inversion, ``"delta"`` or
+        ``"monte_carlo"``. By default ``"delta"``.
+    n_samples : int, optional
+        Number of Monte Carlo draws, by default 1000.
+    retry_failed : bool, optional
+        Whether to rerun sessions that previously ended in an error,
+        by default False.
+
+    Returns
+    -------
+    list[dict]
+        The rows of the results table, in manifest order.
+    """
+    output = Path(output)
+    parts_dir = output.with_name(output.name + ".parts")
+    parts_dir.mkdir(parents=True, exist_ok=True)
+
+    sessions = read_manifest(manifest)
+    done = {}
+    for s in sessions:
+        part = parts_dir / (_part_name(s["session"]) + ".json")
+        if part.exists():
+            row = json.loads(part.read_text())
+            if row.get("status") == "ok" or not retry_failed:
+                done[s["session"]] = row
+    todo = [s for s in sessions if s["session"] not in done]
+    print(f"{len(done)} of {len(sessions)} sessions already finished")
+
+    args = [(s["session"], s["path"], parts_dir, method, n_samples) for s in todo]
+    if jobs <= 1:
+        for i, a in enumerate(args):
+            row = _run_and_save(*a)
+            done[row["session"]] = row
+            print(f"[{i + 1}/{len(args)}] {row['session']}: {row['status']}")
+    else:
+        record = instrumentation.enabled()
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [
+                pool.submit(instrumentation.call_recorded, record, _run_and_save, *a)
+                for a in args
+            ]
+            for i, future in enumerate(as_completed(futures)):
+                row, metrics = future.result()
+                instrumentation.merge(metrics)
+                done[row["session"]] = row
+                print(f"[{i + 1}/{len(args)}] {row['session']}: {row['status']}")
+
+    rows = [done[s["session"]] for s in sessions]
+    _write_results(rows, output)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Fit calibrations and infer irradiance for many sessions."
+    )
+    parser.add_argument("manifest", help="CSV, Parquet or npz session manifest")
+    parser.add_argument("output", help="results table (.csv or .parquet)")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count(), help="worker processes"
+    )
+    parser.add_argument(
+        "--method", choices=("delta", "monte_carlo"), default="delta"
+    )
+    parser.add_argument("--n-samples", type=int, default=1000)
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="rerun sessions that failed in a previous run",
+    )
+    args = parser.parse_args(argv)
+    rows = run_batch(
+        args.manifest,
+        args.output,
+        jobs=args.jobs,
+        method=args.method,
+        n_samples=args.n_samples,
+        retry_failed=args.retry_failed,
+    )
+    n_failed = sum(row["status"] != "ok" for row in rows)
+    if n_failed:
+        print(f"{n_failed} sessions failed; see the 'error' column of {args.output}")
+    return 1 if n_failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
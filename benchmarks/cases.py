@@ -0,0 +1,264 @@
+"""Benchmark cases for the GECI, fitting, inversion and opsin hot paths.
+
+Cases needing cleo/Brian2 are skipped when those can't be imported, whether
+they are missing or fail at import (e.g. Brian2 with an incompatible NumPy).
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import sys
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from harness import SkipBenchmark, benchmark
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+INDICATOR_NAMES = (
+    "gcamp6f", "gcamp6s", "gcamp3", "ogb1", "gcamp6rs09", "gcamp6rs06",
+    "jgcamp7f", "jgcamp7s", "jgcamp7b", "jgcamp7c",
+)  # fmt: skip
+
+# calibration data from ``updated irrdiance finder.py``
+DELTAF_OVER_DELTA = np.array([0.054195194, 0.276633455, 0.298183008, 0.337285643, 0.348150156, 0.489879183, 0.782472723, 2.893888292, 4.917773572, 9.78099666])  # fmt: skip
+PHYSIOLOGICAL_RESPONSE = np.array([1.076414424, 1.588873984, 1.759693837, 1.930513691, 2.272153397, 2.613793103, 2.784612957, 3.126252663, 3.638712223, 3.801767537])  # fmt: skip
+# light-dependence data from ``Fitted Light Dependent Curves Updated.py``
+LIGHT_INTENSITIES = np.array([0.16452872, 0.18718561, 0.26935816, 0.26997261, 0.74285427, 1.42167679, 1.49459703, 2.30448815, 3.14298585, 3.4631732])  # fmt: skip
+
+
+def require(*modules: str) -> None:
+    """Imports ``modules``, skipping the benchmark if any can't be imported"""
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            raise SkipBenchmark(f"needs {e.name}") from None
+        except Exception as e:  # installed, but broken in this environment
+            raise SkipBenchmark(f"{name} fails to import: {type(e).__name__}: {e}") from None  # fmt: skip
+
+
+@lru_cache(maxsize=None)
+def sensors_module():
+    """Loads the sensors module (``from __future__ import annotations.py``) by path"""
+    require("brian2", "cleo")
+    path = ROOT / "from __future__ import annotations.py"
+    spec = importlib.util.spec_from_file_location("sip_sensors", path)
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+    except ImportError as e:
+        raise SkipBenchmark(f"sensors module needs {e.name}") from None
+    return module
+
+
+# --- GECI construction and stepping ------------------------------------------
+
+
+@benchmark("geci.factory", sizes=[10, 100, 1000], quick_sizes=[10])
+def _geci_factory(n):
+    sensors = sensors_module()
+    factories = [getattr(sensors, name) for name in INDICATOR_NAMES]
+
+    def run():
+        for k in range(n):
+            factories[k % len(factories)]()
+
+    return run
+
+
+@benchmark("geci.params", sizes=[10, 100, 1000], quick_sizes=[10])
+def _geci_params(n):
+    sensors = sensors_module()
+    gecis = [getattr(sensors, INDICATOR_NAMES[k % 10])() for k in range(n)]
+
+    def run():
+        for geci in gecis:
+            geci.params
+
+    return run
+
+
+@benchmark("geci.brian2_step", sizes=[100, 1000, 10000], quick_sizes=[100])
+def _geci_brian2_step(n_neurons):
+    sensors = sensors_module()
+    import brian2 as b2
+    import cleo
+
+    b2.prefs.codegen.target = "numpy"
+    ng = b2.NeuronGroup(
+        n_neurons,
+        "dv/dt = (1.2 - v) / (10*ms) : 1",
+        threshold="v > 1",
+        reset="v = 0",
+    )
+    sim = cleo.CLSimulator(b2.Network(ng))
+    sim.inject(sensors.gcamp6f(), ng)
+    n_steps = 100
+
+    def run():
+        sim.run(n_steps * b2.defaultclock.dt)
+
+    return run
+
+
+# --- light-dependence fitting -------------------------------------------------
+
+
+@benchmark("light_dependence.fit_excitation", sizes=[10, 100, 1000], quick_sizes=[10])
+def _fit_excitation(n_points):
+    from light_dependence import LightExcitation
+
+    rng = np.random.default_rng(0)
+    x = np.linspace(LIGHT_INTENSITIES[0], LIGHT_INTENSITIES[-1], n_points)
+    y = LightExcitation.hill_function(x, 3.0, 1.0, 1.5, 0.8)
+    y += rng.normal(0, 0.05, n_points)
+
+    def run():
+        LightExcitation().fit_excitation(x, y)
+
+    return run
+
+
+@benchmark("light_dependence.fit_curves", sizes=[1, 13, 100], quick_sizes=[1])
+def _fit_light_dependence_curves(n_indicators):
+    from light_dependence import fit_light_dependence_curves
+
+    rng = np.random.default_rng(0)
+    responses = {
+        f"indicator{k}": PHYSIOLOGICAL_RESPONSE * rng.uniform(0.8, 1.2)
+        for k in range(n_indicators)
+    }
+
+    def run():
+        fit_light_dependence_curves(LIGHT_INTENSITIES, responses)
+
+    return run
+
+
+# --- irradiance inversion -----------------------------------------------------
+
+
+@benchmark("irradiance.infer", sizes=[10**3, 10**5, 10**6], quick_sizes=[10**3])
+def _infer_light_intensity(n_peaks):
+    from irradiance_uncertainty import fit_calibration, infer_light_intensity
+
+    popt, _ = fit_calibration(DELTAF_OVER_DELTA, PHYSIOLOGICAL_RESPONSE)
+    peaks = np.random.default_rng(0).uniform(1.5, 3.5, n_peaks)
+    return lambda: infer_light_intensity(peaks, popt)
+
+
+@benchmark("irradiance.delta", sizes=[10**3, 10**5, 10**6], quick_sizes=[10**3])
+def _infer_delta(n_peaks):
+    from irradiance_uncertainty import (
+        fit_calibration,
+        infer_light_intensity_with_uncertainty,
+    )
+
+    popt, pcov = fit_calibration(DELTAF_OVER_DELTA, PHYSIOLOGICAL_RESPONSE)
+    peaks = np.random.default_rng(0).uniform(1.5, 3.5, n_peaks)
+    return lambda: infer_light_intensity_with_uncertainty(peaks, popt, pcov)
+
+
+@benchmark(
+    "irradiance.monte_carlo", sizes=[10**3, 10**5, 10**6], quick_sizes=[10**3]
+)
+def _infer_monte_carlo(n_peaks):
+    from irradiance_uncertainty import (
+        fit_calibration,
+        infer_light_intensity_with_uncertainty,
+    )
+
+    popt, pcov = fit_calibration(DELTAF_OVER_DELTA, PHYSIOLOGICAL_RESPONSE)
+    peaks = np.random.default_rng(0).uniform(1.5, 3.5, n_peaks)
+    return lambda: infer_light_intensity_with_uncertainty(
+        peaks, popt, pcov, method="monte_carlo", rng=0
+    )
+
+
+# --- transform-pair search ----------------------------------------------------
+
+
+@benchmark("transform_search.power_grid", sizes=[4, 51, 201], quick_sizes=[4])
+def _transform_search(n_lambdas):
+    """The action-spectra script's search, with an ``n_lambdas`` power grid
+    (4 is the script's identity/log/sqrt/square) on both axes"""
+    from transform_search import PowerTransforms, search_transform_pairs
+
+    irr_1p = np.array([0.133811937, 0.285329021, 0.345634606, 0.161432626, 0.381335054])
+    I_1p = np.array([0.01831372, 0.469307388, 0.972508906, 1.002046634, 0.750938527])
+    irr_2p = np.array([5.05107089, 7.94328048, 12.12580401, 10.2656456, 5.15714371])
+    I_2p = np.array([0.017954882, 0.225418517, 0.492782039, 0.759697007, 0.998009278])
+    lambdas = [1, 0, 0.5, 2] if n_lambdas == 4 else np.linspace(-2, 3, n_lambdas)
+    family = PowerTransforms(lambdas)
+
+    def run():
+        search_transform_pairs(family, family, [irr_1p, irr_2p], [I_1p, I_2p]).best()
+
+    return run
+
+
+# --- opsins -------------------------------------------------------------------
+
+
+@benchmark("opsin.registry_build", sizes=[1])
+def _registry_build(_):
+    from opsin_registry import OpsinRegistry
+
+    return OpsinRegistry
+
+
+@benchmark("opsin.params_lookup", sizes=[10**4])
+def _params_lookup(n):
+    from opsin_registry import REGISTRY
+
+    names = REGISTRY.names
+
+    def run():
+        for k in range(n):
+            REGISTRY.params(names[k % len(names)])
+
+    return run
+
+
+@benchmark("opsin.model_build", sizes=[8, 80], quick_sizes=[8])
+def _opsin_model_build(n):
+    """Equivalent of calling the opsin factories ``n`` times"""
+    from opsin_registry import REGISTRY
+
+    require("brian2", "cleo")
+    REGISTRY.spec("ChR2").model()
+
+    def run():
+        for k in range(n):
+            REGISTRY.spec(REGISTRY.names[k % len(REGISTRY)]).model()
+
+    return run
+
+
+@benchmark("photocurrent.engine", sizes=[10, 1000, 10000], quick_sizes=[10])
+def _photocurrent_engine(n_protocols):
+    from photocurrent import (
+        OPSIN_PARAMS,
+        PhotocurrentEngine,
+        irradiance_to_photon_flux,
+        pulse_train,
+    )
+
+    dt = 0.1
+    irr = np.logspace(-2, 2, n_protocols)
+    phi = pulse_train(irradiance_to_photon_flux(irr, 590), 5, 20, 5, 300, dt, 10)
+    opsin_idx = np.arange(n_protocols) % len(OPSIN_PARAMS)
+    engine = PhotocurrentEngine(list(OPSIN_PARAMS), dt)
+    return lambda: engine.run(opsin_idx, phi)
+
+
+@benchmark("photocurrent.steady_state", sizes=[100, 10**4, 10**6], quick_sizes=[100])
+def _steady_state(n_irradiances):
+    from photocurrent import OPSIN_PARAMS, dose_response
+
+    irr = np.logspace(-3, 3, n_irradiances)
+    return lambda: dose_response(list(OPSIN_PARAMS), irr, 590)
@@ -0,0 +1,196 @@
+"""Timing, peak-memory, history and regression checks for the benchmark suite."""
+
+from __future__ import annotations
+
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Sequence
+
+from attrs import define, field
+
+BENCHMARKS: dict[str, Benchmark] = {}
+
+
+class SkipBenchmark(Exception):
+    """Raised by a setup function when the benchmark can't run here"""
+
+
+@define(eq=False)
+class Benchmark:
+    """A parameterized benchmark.
+
+    ``setup(size)`` does the untimed preparation and returns the zero-argument
+    function to time."""
+
+    name: str
+    setup: Callable[[int], Callable[[], object]]
+    sizes: Sequence[int]
+    quick_sizes: Sequence[int] = field(default=None)
+    """smaller sizes used with ``--quick``; defaults to the first of :attr:`sizes`"""
+
+
+def benchmark(name: str, sizes: Sequence[int], quick_sizes: Sequence[int] = None):
+    """Registers the decorated setup function as a benchmark"""
+
+    def decorator(setup):
+        BENCHMARKS[name] = Benchmark(
+            name, setup, list(sizes), list(quick_sizes or sizes[:1])
+        )
+        return setup
+
+    return decorator
+
+
+def measure(fn: Callable[[], object], min_time: float = 0.2, repeat: int = 5) -> dict:
+    """Best-of-``repeat`` wall time per call and peak traced memory of one call.
+
+    Each repeat calls ``fn`` enough times to take at least ``min_time``.
+    Peak memory is measured separately with ``tracemalloc`` (which NumPy
+    reports its buffers to), so tracing overhead doesn't skew the timing.
+    """
+    fn()  # warm-up: imports, caches, code generation
+    number, elapsed = 1, 0.0
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number *= 2 if elapsed == 0 else max(2, int(min_time / elapsed * 1.2))
+    times = [elapsed / number]
+    for _ in range(repeat - 1):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - t0) / number)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "time_s": min(times),
+        "time_median_s": statistics.median(times),
+        "number": number,
+        "peak_mem_bytes": peak,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=Path(__file__).parent,
+            timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run_benchmarks(
+    names: Sequence[str] | None = None, quick: bool = False, **measure_kwargs
+) -> list[dict]:
+    """Runs the selected benchmarks at each of their sizes"""
+    context = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": _git_commit(),
+        "machine": platform.node(),
+        "python": platform.python_version(),
+    }
+    records = []
+    for name, bench in BENCHMARKS.items():
+        if names and not any(n in name for n in names):
+            continue
+        for size in bench.quick_sizes if quick else bench.sizes:
+            record = {**context, "benchmark": name, "size": size}
+            try:
+                fn = bench.setup(size)
+                record.update(measure(fn, **measure_kwargs))
+                record["status"] = "ok"
+            except SkipBenchmark as e:
+                record["status"] = f"skipped: {e}"
+            except Exception as e:  # one broken case shouldn't end the run
+                record["status"] = f"error: {type(e).__name__}: {e}"
+            records.append(record)
+            print(format_record(record), flush=True)
+    return records
+
+
+def format_record(record: dict) -> str:
+    label = f"{record['benchmark']}[{record['size']}]"
+    if record["status"] != "ok":
+        return f"{label:<48} {record['status']}"
+    return (
+        f"{label:<48} {record['time_s'] * 1e3:12.4f} ms"
+        f" {record['peak_mem_bytes'] / 2**20:10.2f} MiB"
+    )
+
+
+def load_history(path: str | os.PathLike) -> list[dict]:
+    path = Path(path)
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def append_history(path: str | os.PathLike, records: Sequence[dict]) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def find_regressions(
+    records: Sequence[dict],
+    history: Sequence[dict],
+    threshold: float = 0.2,
+    window: int = 5,
+) -> list[str]:
+    """Compares each result to the median of its last ``window`` runs on this machine.
+
+    Returns a message for every time or peak-memory increase above ``threshold``
+    (a fraction, e.g. 0.2 for 20%).
+    """
+    messages = []
+    for record in records:
+        if record["status"] != "ok":
+            continue
+        previous = [
+            h
+            for h in history
+            if h["benchmark"] == record["benchmark"]
+            and h["size"] == record["size"]
+            and h.get("machine") == record["machine"]
+            and h["status"] == "ok"
+        ][-window:]
+        if not previous:
+            continue
+        for metric, unit, scale in (
+            ("time_s", "ms", 1e3),
+            ("peak_mem_bytes", "MiB", 1 / 2**20),
+        ):
+            baseline = statistics.median(h[metric] for h in previous)
+            if baseline > 0 and record[metric] > baseline * (1 + threshold):
+                messages.append(
+                    f"{record['benchmark']}[{record['size']}] {metric}: "
+                    f"{record[metric] * scale:.4g} {unit} vs baseline "
+                    f"{baseline * scale:.4g} {unit} "
+                    f"(+{record[metric] / baseline - 1:.0%})"
+                )
+    return messages
@@ -0,0 +1,84 @@
+"""Runs the benchmark suite, records results and flags regressions.
+
+Usage::
+
+    python benchmarks/run_benchmarks.py              # full sizes
+    python benchmarks/run_benchmarks.py --quick      # smallest sizes only
+    python benchmarks/run_benchmarks.py -k irradiance -k opsin
+
+Each run is appended to ``benchmarks/results/history.jsonl`` (one JSON line
+per benchmark and size, with commit, machine, time and peak memory), which git
+ignores: the history is per machine. A result
+more than ``--threshold`` slower, or using that much more peak memory, than the
+median of its previous runs on the same machine is reported as a regression
+and makes the command exit with status 1.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import cases  # noqa: E402,F401  (registers the benchmarks)
+from harness import (  # noqa: E402
+    BENCHMARKS,
+    append_history,
+    find_regressions,
+    load_history,
+    run_benchmarks,
+)
+
+DEFAULT_HISTORY = Path(__file__).resolve().parent / "results" / "history.jsonl"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-k",
+        dest="names",
+        action="append",
+        help="only run benchmarks whose name contains this (repeatable)",
+    )
+    parser.add_argument("--quick", action="store_true", help="smallest sizes only")
+    parser.add_argument("--list", action="store_true", help="list benchmarks and exit")
+    parser.add_argument("--history", type=Path, default=DEFAULT_HISTORY)
+    parser.add_argument(
+        "--no-save", action="store_true", help="don't append results to the history"
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative slowdown/memory increase flagged as a regression",
+    )
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, bench in BENCHMARKS.items():
+            print(f"{name}: sizes {list(bench.sizes)}")
+        return 0
+
+    records = run_benchmarks(
+        args.names, quick=args.quick, min_time=args.min_time, repeat=args.repeat
+    )
+    regressions = find_regressions(
+        records, load_history(args.history), threshold=args.threshold
+    )
+    if not args.no_save:
+        append_history(args.history, records)
+
+    if regressions:
+        print("\nRegressions:")
+        for message in regressions:
+            print("  " + message)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
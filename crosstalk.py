@@ -0,0 +1,237 @@
+"""Spectral crosstalk between GECI sensors and opsins in all-optical experiments.
+
+Imaging light meant for a sensor (``Sensor.exc_spectrum``) also activates the
+opsin (``spectrum`` in ``new add ons to opsin_library.py``), and stimulation
+light meant for the opsin also excites the sensor. :func:`crosstalk_matrix`
+evaluates every sensor and opsin spectrum against every light source in one
+vectorized pass (via :class:`spectra.SpectrumTable`) and forms the
+(sensor, opsin, light source) cross-activation ratios by broadcasting.
+
+Two-photon sources are mapped to the one-photon spectra at half their
+wavelength (and half their bandwidth), the usual first approximation when no
+measured 2P spectrum is available.
+
+Spectra given as a single point (e.g. ``[(593, 1)]`` for Jaws and NpHR) are
+known only at that wavelength. They give that value for a monochromatic source
+at exactly that (effective) wavelength and NaN for every other source, the
+same as missing spectra, rather than numbers on an incomparable scale.
+:func:`crosstalk_matrix` warns, naming the sensors and opsins and the sources,
+whenever that leaves NaN in the matrix. This is the case for the registry
+opsins used by default, none of which has a measured spectrum yet.
+
+Results can be cached to disk. The cache file name is a hash of every input
+spectrum, light source and the wavelength grid, so changing any of them
+automatically misses the old entry.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import warnings
+from pathlib import Path
+from typing import Mapping, Sequence
+
+import numpy as np
+from attrs import define, frozen
+
+from opsin_registry import REGISTRY
+from spectra import DEFAULT_GRID, SpectrumTable, gaussian_sources
+
+
+@frozen
+class LightSource:
+    """A (possibly broadband) one- or two-photon light source"""
+
+    name: str
+    wavelength_nm: float
+    """center wavelength (nm)"""
+    photons: int = 1
+    """1 for one-photon, 2 for two-photon excitation"""
+    fwhm_nm: float = 0.0
+    """spectral bandwidth (nm); 0 for monochromatic"""
+
+    @property
+    def effective_wavelength_nm(self) -> float:
+        """wavelength at which to read the one-photon spectra"""
+        return self.wavelength_nm / self.photons
+
+    @property
+    def effective_fwhm_nm(self) -> float:
+        return self.fwhm_nm / self.photons
+
+
+@define(eq=False)
+class CrosstalkMatrix:
+    """Activation of every sensor and opsin by every light source"""
+
+    sensor_names: list[str]
+    opsin_names: list[str]
+    sources: list[LightSource]
+    sensor_exc: np.ndarray
+    """``(n_sensors, n_sources)`` relative sensor excitation"""
+    opsin_act: np.ndarray
+    """``(n_opsins, n_sources)`` relative opsin activation"""
+
+    @property
+    def opsin_per_sensor(self) -> np.ndarray:
+        """``(n_sensors, n_opsins, n_sources)``: opsin activation per unit
+        sensor excitation when imaging with each source. Lower is better for
+        imaging sources."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.opsin_act[None, :, :] / self.sensor_exc[:, None, :]
+
+    @property
+    def sensor_per_opsin(self) -> np.ndarray:
+        """``(n_sensors, n_opsins, n_sources)``: sensor excitation per unit
+        opsin activation when stimulating with each source. Lower is better
+        for stimulation sources."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.sensor_exc[:, None, :] / self.opsin_act[None, :, :]
+
+    def save(self, path: str | os.PathLike) -> None:
+        np.savez(
+            path,
+            sensor_exc=self.sensor_exc,
+            opsin_act=self.opsin_act,
+            meta=json.dumps(
+                {
+                    "sensor_names": self.sensor_names,
+                    "opsin_names": self.opsin_names,
+                    "sources": [_source_tuple(s) for s in self.sources],
+                }
+            ),
+        )
+
+    @classmethod
+    def load(cls, path: str | os.PathLike) -> CrosstalkMatrix:
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls(
+                meta["sensor_names"],
+                meta["opsin_names"],
+                [LightSource(*s) for s in meta["sources"]],
+                data["sensor_exc"],
+                data["opsin_act"],
+            )
+
+
+def _source_tuple(s: LightSource) -> list:
+    return [s.name, s.wavelength_nm, s.photons, s.fwhm_nm]
+
+
+def _activation(table: SpectrumTable, sources: Sequence[LightSource]) -> np.ndarray:
+    """``(len(table), len(sources))`` activation, monochromatic and broadband
+    sources each handled in one vectorized call"""
+    out = np.empty((len(table), len(sources)))
+    mono = [k for k, s in enumerate(sources) if s.fwhm_nm == 0]
+    broad = [k for k, s in enumerate(sources) if s.fwhm_nm > 0]
+    if mono:
+        out[:, mono] = table([sources[k].effective_wavelength_nm for k in mono])
+    if broad:
+        spectra = gaussian_sources(
+            [sources[k].effective_wavelength_nm for k in broad],
+            [sources[k].effective_fwhm_nm for k in broad],
+            table.grid,
+        )
+        out[:, broad] = table.integrate(spectra)
+    return out
+
+
+def _warn_unusable(kind: str, names, activation, sources) -> None:
+    missing = np.isnan(activation)
+    if not missing.any():
+        return
+    bad = [n for n, row in zip(names, missing) if row.any()]
+    bad_sources = [s.name for s, col in zip(sources, missing.T) if col.any()]
+    warnings.warn(
+        f"no usable spectrum for {kind} {', '.join(bad)} under light source(s) "
+        f"{', '.join(bad_sources)}: their activation is NaN. Empty spectra are "
+        "unknown everywhere, single-point spectra everywhere except under a "
+        "monochromatic source at that wavelength.",
+        stacklevel=3,
+    )
+
+
+# bump when the computation changes, so old cache entries miss
+_CACHE_VERSION = 2
+
+
+def _points(spectrum) -> list[list[float]]:
+    return sorted([float(wl), float(value)] for wl, value in spectrum)
+
+
+def _cache_key(sensor_spectra, opsin_spectra, sources, grid) -> str:
+    payload = json.dumps(
+        {
+            "version": _CACHE_VERSION,
+            "sensors": {k: _points(v) for k, v in sensor_spectra.items()},
+            "opsins": {k: _points(v) for k, v in opsin_spectra.items()},
+            "sources": [_source_tuple(s) for s in sources],
+            "grid": [float(grid[0]), float(grid[-1]), len(grid)],
+        },
+        sort_keys=True,
+    )
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+def crosstalk_matrix(
+    sensor_spectra: Mapping[str, Sequence[tuple[float, float]]],
+    sources: Sequence[LightSource],
+    opsin_spectra: Mapping[str, Sequence[tuple[float, float]]] | None = None,
+    grid: np.ndarray = DEFAULT_GRID,
+    cache_dir: str | os.PathLike | None = None,
+) -> CrosstalkMatrix:
+    """Computes (or loads from cache) the sensor/opsin crosstalk matrix.
+
+    Parameters
+    ----------
+    sensor_spectra : Mapping[str, Sequence[tuple[float, float]]]
+        ``{name: sensor.exc_spectrum}`` for each sensor.
+    sources : Sequence[LightSource]
+        Imaging and stimulation light sources.
+    opsin_spectra : Mapping[str, Sequence[tuple[float, float]]], optional
+        ``{name: opsin.spectrum}``; by default every opsin in
+        :data:`opsin_registry.REGISTRY`.
+    grid : np.ndarray, optional
+        Wavelength grid for the spectrum tables.
+    cache_dir : str | os.PathLike, optional
+        Directory for cached results; no caching if None.
+
+    Returns
+    -------
+    CrosstalkMatrix
+
+    Warns
+    -----
+    UserWarning
+        If a sensor or opsin has no usable spectrum for some source, naming
+        them; those entries are NaN.
+    """
+    if opsin_spectra is None:
+        opsin_spectra = REGISTRY.spectra()
+    sources = list(sources)
+
+    cache_path = None
+    if cache_dir is not None:
+        key = _cache_key(sensor_spectra, opsin_spectra, sources, grid)
+        cache_path = Path(cache_dir) / f"crosstalk-{key}.npz"
+    if cache_path is not None and cache_path.exists():
+        result = CrosstalkMatrix.load(cache_path)
+    else:
+        sensors = SpectrumTable.from_spectra(dict(sensor_spectra), grid)
+        opsins = SpectrumTable.from_spectra(dict(opsin_spectra), grid)
+        result = CrosstalkMatrix(
+            sensors.names,
+            opsins.names,
+            sources,
+            _activation(sensors, sources),
+            _activation(opsins, sources),
+        )
+        if cache_path is not None:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            result.save(cache_path)
+    _warn_unusable("sensors", result.sensor_names, result.sensor_exc, sources)
+    _warn_unusable("opsins", result.opsin_names, result.opsin_act, sources)
+    return result
@@ -0,0 +1,428 @@
+"""Opt-in performance metrics for fits, Brian2 code generation and inversion.
+
+Instrumentation is off by default. Each instrumented call site checks a
+single module global, so leaving it off costs about as much as an attribute
+lookup. Turn it on in any of these ways:
+
+- run a script through this module from the repository root (or with it on
+  ``PYTHONPATH``), e.g.
+  ``python -m instrumentation -o metrics.json "Fitted Light Dependent Curves Updated.py"``.
+  This profiles scripts that never import :mod:`instrumentation` without
+  changing them: besides the Brian2 hooks, ``scipy.optimize.curve_fit`` and
+  ``least_squares`` are wrapped for the run, so the scripts' own fits (e.g.
+  their ``LightExcitation.fit_excitation``) are recorded too
+- set ``SIP_METRICS=metrics.json`` (or ``.csv``) in the environment. This
+  only takes effect in programs that import :mod:`instrumentation`, directly
+  or through an instrumented module such as :mod:`batch_calibration`,
+  :mod:`irradiance_uncertainty`, :mod:`light_dependence` or
+  :mod:`opsin_fitting`. The metrics are written to that file at exit
+- call :func:`enable` / :func:`disable`
+- use the :func:`instrument` context manager
+
+Work done in process pools (``batch_calibration --jobs``,
+``opsin_fitting.fit_multistart``) is recorded in the workers through
+:func:`call_recorded` and merged into the parent's recorder.
+
+Each metric is one flat dict with a ``metric`` name and a ``wall_s`` duration.
+The metrics are:
+
+``fit``
+    One per ``curve_fit``/``least_squares`` call, with ``model`` and ``nfev``.
+    Under the runner, fits made outside the instrumented modules have the
+    fitted function's qualified name as their ``model``.
+``inversion``
+    One per irradiance inversion, with ``method`` and the number of peaks
+    ``n``. :meth:`MetricsRecorder.summary` reports the throughput.
+``brian2_compile``
+    One per Brian2 code object compiled, with the owning group and its model
+    equations.
+``brian2_build``
+    Code generation plus compilation for a whole ``Network.before_run``.
+``brian2_run``
+    Wall time of each ``Network.run``.
+``brian2_step``
+    One per group (NeuronGroup, GECI ``Sensor`` synapses, ...) per
+    ``Network.run``, with ``n`` elements (neurons for sensors), ``n_steps``
+    and ``step_s``, the mean time per step. Enabling Brian2 hooks turns on
+    Brian2's own per-object profiling to get these.
+"""
+
+from __future__ import annotations
+
+import argparse
+import atexit
+import csv
+import json
+import multiprocessing
+import os
+import runpy
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from attrs import define, field
+
+ENV_VAR = "SIP_METRICS"
+
+
+@define(eq=False)
+class MetricsRecorder:
+    """Collects metric records in memory and exports them"""
+
+    sink: str | os.PathLike | None = None
+    """``.json`` or ``.csv`` file written by :meth:`export`/:func:`disable`"""
+    records: list[dict] = field(factory=list)
+
+    def record(self, metric: str, **fields) -> None:
+        self.records.append({"metric": metric, "timestamp": time.time(), **fields})
+
+    def summary(self) -> dict[str, dict]:
+        """Count and total ``wall_s`` per metric (and ``n``/s where recorded)"""
+        out = {}
+        for r in self.records:
+            s = out.setdefault(r["metric"], {"count": 0, "wall_s": 0.0})
+            s["count"] += 1
+            s["wall_s"] += r.get("wall_s", 0.0)
+            if r["metric"] == "inversion":
+                s["n"] = s.get("n", 0) + r["n"]
+        for s in out.values():
+            if "n" in s and s["wall_s"] > 0:
+                s["n_per_s"] = s["n"] / s["wall_s"]
+        return out
+
+    def export(self, path: str | os.PathLike | None = None) -> Path:
+        """Writes all records as JSON (a list of objects) or CSV, by extension"""
+        path = Path(path if path is not None else self.sink)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix.lower() == ".csv":
+            columns = list(dict.fromkeys(k for r in self.records for k in r))
+            with open(path, "w", newline="") as f:
+                writer = csv.DictWriter(f, columns)
+                writer.writeheader()
+                writer.writerows(self.records)
+        else:
+            with open(path, "w") as f:
+                json.dump(self.records, f, indent=1, default=str)
+        return path
+
+
+class _Timer:
+    __slots__ = ("recorder", "metric", "fields", "t0")
+
+    def __init__(self, recorder, metric, fields):
+        self.recorder, self.metric, self.fields = recorder, metric, fields
+
+    def __enter__(self) -> dict:
+        _open_metrics.append(self.metric)
+        self.t0 = time.perf_counter()
+        return self.fields
+
+    def __exit__(self, exc_type, exc, tb):
+        wall_s = time.perf_counter() - self.t0
+        _open_metrics.pop()
+        if exc_type is not None:
+            self.fields["error"] = exc_type.__name__
+        self.recorder.record(self.metric, wall_s=wall_s, **self.fields)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> dict:
+        return {}
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+_recorder: MetricsRecorder | None = None
+_brian2_originals: dict = {}
+_scipy_originals: dict = {}
+# metrics being timed, so the scipy hooks don't record a fit twice
+_open_metrics: list[str] = []
+_run_objects: dict[int, dict] = {}
+
+
+def enabled() -> bool:
+    return _recorder is not None
+
+
+def recorder() -> MetricsRecorder | None:
+    """The active recorder, or None when instrumentation is off"""
+    return _recorder
+
+
+def timed(metric: str, **fields):
+    """Context manager timing its body as one ``metric`` record.
+
+    It yields a dict; entries added to it (e.g. ``nfev``) are recorded too.
+    A shared no-op is returned while instrumentation is off.
+    """
+    if _recorder is None:
+        return _NULL_TIMER
+    return _Timer(_recorder, metric, fields)
+
+
+def enable(
+    sink: str | os.PathLike | None = None, brian2: bool = True
+) -> MetricsRecorder:
+    """Starts recording (replacing any active recorder).
+
+    Parameters
+    ----------
+    sink : str | os.PathLike, optional
+        File the metrics are exported to by :func:`disable`.
+    brian2 : bool, optional
+        Also hook Brian2 compilation and per-step timing, if Brian2 imports.
+    """
+    global _recorder
+    _recorder = MetricsRecorder(sink)
+    if brian2:
+        _install_brian2_hooks()
+    return _recorder
+
+
+def disable() -> MetricsRecorder | None:
+    """Stops recording, exports to the sink if one was given and returns the recorder"""
+    global _recorder
+    rec, _recorder = _recorder, None
+    _uninstall_brian2_hooks()
+    if rec is not None and rec.sink is not None:
+        rec.export()
+    return rec
+
+
+def call_recorded(record: bool, fn, /, *args, **kwargs):
+    """Runs ``fn`` (in a pool worker) and returns ``(result, records)``.
+
+    Workers can't export to the parent's sink, so the records go back with
+    the result for the parent to :func:`merge`. Pass ``record=enabled()`` from
+    the parent; the worker records into a fresh recorder, since a forked
+    worker would otherwise hold a copy of the parent's.
+    """
+    global _recorder
+    if not record:
+        return fn(*args, **kwargs), []
+    previous, _recorder = _recorder, MetricsRecorder()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        rec, _recorder = _recorder, previous
+    pid = os.getpid()
+    return result, [{**r, "pid": pid} for r in rec.records]
+
+
+def merge(records: list[dict]) -> None:
+    """Adds records from :func:`call_recorded` to the active recorder"""
+    if _recorder is not None:
+        _recorder.records.extend(records)
+
+
+@contextmanager
+def instrument(sink: str | os.PathLike | None = None, brian2: bool = True):
+    """Records metrics for the duration of the ``with`` block"""
+    rec = enable(sink, brian2)
+    try:
+        yield rec
+    finally:
+        if _recorder is rec:
+            disable()
+
+
+# --- Brian2 hooks -------------------------------------------------------------
+
+
+def _model_string(owner) -> str:
+    equations = getattr(owner, "equations", None)
+    return str(equations) if equations is not None else ""
+
+
+def _install_brian2_hooks() -> None:
+    if _brian2_originals:
+        return
+    try:
+        from brian2 import Network
+        from brian2.codegen.codeobject import CodeObject
+    except Exception:  # not installed, or incompatible with this NumPy
+        return
+
+    compile_ = CodeObject.compile
+    before_run = Network.before_run
+    run = Network.run
+
+    def compile(self):
+        with timed(
+            "brian2_compile",
+            code_object=self.name,
+            group=getattr(self.owner, "name", ""),
+            model=_model_string(self.owner),
+        ):
+            return compile_(self)
+
+    def timed_before_run(self, run_namespace):
+        with timed("brian2_build", network=self.name):
+            result = before_run(self, run_namespace)
+        if _recorder is not None:
+            # MagicNetwork forgets its objects after the run, so keep them here
+            _run_objects[id(self)] = {obj.name: obj for obj in self.sorted_objects}
+        return result
+
+    def profiled_run(
+        self, duration, report=None, report_period=None, namespace=None,
+        profile=None, level=0,
+    ):  # fmt: skip
+        kwargs = dict(report=report, namespace=namespace, level=level + 1)
+        if report_period is not None:
+            kwargs["report_period"] = report_period
+        if _recorder is None:
+            return run(self, duration, profile=profile, **kwargs)
+        t0 = time.perf_counter()
+        if profile is None:
+            profile = True
+        result = run(self, duration, profile=profile, **kwargs)
+        _recorder.record(
+            "brian2_run", network=self.name, wall_s=time.perf_counter() - t0
+        )
+        _record_step_times(self, duration)
+        return result
+
+    CodeObject.compile = compile
+    Network.before_run = timed_before_run
+    Network.run = profiled_run
+    _brian2_originals.update(
+        {(CodeObject, "compile"): compile_, (Network, "before_run"): before_run,
+         (Network, "run"): run}
+    )  # fmt: skip
+
+
+def _record_step_times(net, duration) -> None:
+    try:
+        profiling_info = net.profiling_info
+    except ValueError:  # run with profile=False
+        return
+    objects = _run_objects.pop(id(net), {})
+    per_group: dict[str, list] = {}
+    for name, t in profiling_info:
+        obj = objects.get(name)
+        # state updaters, thresholders, synaptic pathways etc. belong to a group
+        group = getattr(obj, "group", None) or obj
+        entry = per_group.setdefault(getattr(group, "name", name), [group, obj, 0.0])
+        entry[2] += float(t)
+    for group_name, (group, obj, wall_s) in per_group.items():
+        clock = getattr(obj, "clock", None)
+        n_steps = int(round(float(duration / clock.dt))) if clock is not None else 0
+        try:
+            n = len(group)
+        except TypeError:
+            n = None
+        _recorder.record(
+            "brian2_step",
+            group=group_name,
+            group_type=group.__class__.__name__,  # group may be a weakproxy
+            n=n,
+            n_steps=n_steps,
+            wall_s=wall_s,
+            step_s=wall_s / n_steps if n_steps else None,
+        )
+
+
+def _uninstall_brian2_hooks() -> None:
+    for (cls, name), original in _brian2_originals.items():
+        setattr(cls, name, original)
+    _brian2_originals.clear()
+    _run_objects.clear()
+
+
+# --- scipy hooks --------------------------------------------------------------
+
+
+def _install_scipy_hooks() -> None:
+    """Wraps ``scipy.optimize.curve_fit``/``least_squares`` to record each fit.
+
+    Only names looked up after this are affected, so the runner installs it
+    before the script imports them. Calls already inside a ``fit`` timer (the
+    instrumented modules' own fits) are passed straight through.
+    """
+    if _scipy_originals:
+        return
+    import scipy.optimize
+
+    curve_fit_ = scipy.optimize.curve_fit
+    least_squares_ = scipy.optimize.least_squares
+
+    def curve_fit(f, xdata, ydata, *args, full_output=False, **kwargs):
+        if _recorder is None or "fit" in _open_metrics:
+            return curve_fit_(f, xdata, ydata, *args, full_output=full_output, **kwargs)  # fmt: skip
+        with timed("fit", model=getattr(f, "__qualname__", repr(f))) as metrics:
+            out = curve_fit_(f, xdata, ydata, *args, full_output=True, **kwargs)
+            metrics["nfev"] = int(out[2]["nfev"])
+        return out if full_output else out[:2]
+
+    def least_squares(fun, x0, *args, **kwargs):
+        if _recorder is None or "fit" in _open_metrics:
+            return least_squares_(fun, x0, *args, **kwargs)
+        with timed("fit", model=getattr(fun, "__qualname__", repr(fun))) as metrics:
+            res = least_squares_(fun, x0, *args, **kwargs)
+            metrics["nfev"] = int(res.nfev)
+        return res
+
+    scipy.optimize.curve_fit = curve_fit
+    scipy.optimize.least_squares = least_squares
+    _scipy_originals.update(
+        {(scipy.optimize, "curve_fit"): curve_fit_,
+         (scipy.optimize, "least_squares"): least_squares_}
+    )  # fmt: skip
+
+
+def _uninstall_scipy_hooks() -> None:
+    for (module, name), original in _scipy_originals.items():
+        setattr(module, name, original)
+    _scipy_originals.clear()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m instrumentation",
+        description="Runs a Python script with metrics recording enabled.",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default=os.environ.get(ENV_VAR, "metrics.json"),
+        help="metrics file (.json or .csv)",
+    )
+    parser.add_argument("script")
+    parser.add_argument("args", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    # call sites use the imported module, not this ``__main__`` copy
+    import instrumentation
+
+    sys.argv = [args.script, *args.args]
+    sys.path.insert(0, str(Path(args.script).resolve().parent))
+    instrumentation.enable(args.output)
+    instrumentation._install_scipy_hooks()
+    try:
+        runpy.run_path(args.script, run_name="__main__")
+    finally:
+        instrumentation._uninstall_scipy_hooks()
+        rec = instrumentation.disable()
+        print(f"{len(rec.records)} metrics written to {args.output}", file=sys.stderr)
+    return 0
+
+
+# pool workers return their records to the parent instead of exporting them,
+# and under ``python -m instrumentation`` the runner exports them; a recorder
+# in this ``__main__`` copy would overwrite that file with nothing at exit
+if (
+    os.environ.get(ENV_VAR)
+    and __name__ != "__main__"
+    and multiprocessing.parent_process() is None
+):
+    enable(os.environ[ENV_VAR])
+    atexit.register(disable)
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import numpy as np
+from attrs import define, field
+from scipy.optimize import curve_fit
+from scipy.stats import norm
+
+import instrumentation
+
+
+def model_function(deltaF_over_delta, a, b, c):
+    """Quadratic calibration model, as in ``updated irrdiance finder.py``"""
+    return a * deltaF_over_delta**2 + b * deltaF_over_delta + c
+
+
+def fit_calibration(
+    deltaF_over_delta_data: np.ndarray, physiological_response: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Fits :func:`model_function`, keeping the covariance ``curve_fit`` computes.
+
+    Returns
+    -------
+    tuple[np.ndarray, np.ndarray]
+        ``(popt, pcov)``, the best-fit ``(a, b, c)`` and their 3x3 covariance.
+    """
+    with instrumentation.timed("fit", model="calibration") as metrics:
+        popt, pcov, info, _, _ = curve_fit(
+            model_function,
+            np.asarray(deltaF_over_delta_data, dtype=float),
+            np.asarray(physiological_response, dtype=float),
+            full_output=True,
+        )
+        metrics["nfev"] = int(info["nfev"])
+    return popt, pcov
+
+
+def _roots(deltaF_over_delta, a, b, c, branch):
+    """Real root of ``a x**2 + b x + (c - deltaF_over_delta) = 0``, broadcasting.
+
+    Uses the numerically stable form of the quadratic formula. The ``"major"``
+    branch is the larger-magnitude root, which is what ``np.roots(...)[0]``
+    returned in the original scripts; ``"minor"`` is the other one.
+    NaN where the roots are complex.
+    """
+    c_shift = c - deltaF_over_delta
+    disc = b * b - 4 * a * c_shift
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sqrt_disc = np.sqrt(np.where(disc >= 0, disc, np.nan))
+        q = -0.5 * (b + np.where(b >= 0, sqrt_disc, -sqrt_disc))
+        if branch == "major":
+            return q / a
+        elif branch == "minor":
+            return c_shift / q
+    raise ValueError(f"branch must be 'major' or 'minor', not {branch}")
+
+
+def infer_light_intensity(deltaF_over_delta, popt, branch: str = "major"):
+    """Vectorized version of the scripts' ``infer_light_intensity``.
+
+    Accepts a scalar or an array of ΔF/F0 peaks and solves the fitted quadratic
+    for each of them at once, instead of calling ``np.roots`` per peak.
+    """
+    a, b, c = popt
+    y = np.asarray(deltaF_over_delta, dtype=float)
+    with instrumentation.timed("inversion", method="point", n=y.size):
+        return _roots(y, a, b, c, branch)
+
+
+@define(eq=False)
+class IrradianceEstimate:
+    """Inferred irradiance with its uncertainty, one entry per peak"""
+
+    value: np.ndarray
+    """point estimate from the best-fit parameters (mW/mm²)"""
+    std: np.ndarray
+    """standard deviation of the estimate (mW/mm²)"""
+    lower: np.ndarray
+    """lower bound of the confidence interval (mW/mm²)"""
+    upper: np.ndarray
+    """upper bound of the confidence interval (mW/mm²)"""
+    confidence: float
+    """confidence level of ``[lower, upper]``"""
+    method: str
+    """``"delta"`` or ``"monte_carlo"``"""
+    valid_fraction: np.ndarray = field(default=None)
+    """Monte Carlo only: fraction of parameter draws giving a real root"""
+
+
+def _delta_method(y, popt, pcov, peak_sigma, branch, confidence):
+    a, b, c = popt
+    x = _roots(y, a, b, c, branch)
+    # implicit differentiation of a x**2 + b x + c - y = 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dF_dx = 2 * a * x + b
+        grad = -np.stack([x * x, x, np.ones_like(x)], axis=-1) / dF_dx[..., None]
+        var = np.einsum("...i,ij,...j->...", grad, pcov, grad)
+        if peak_sigma is not None:
+            var = var + (np.asarray(peak_sigma, dtype=float) / dF_dx) ** 2
+    std = np.sqrt(var)
+    z = norm.ppf(0.5 + confidence / 2)
+    return IrradianceEstimate(
+        value=x,
+        std=std,
+        lower=x - z * std,
+        upper=x + z * std,
+        confidence=confidence,
+        method="delta",
+    )
+
+
+def _monte_carlo(y, popt, pcov, peak_sigma, branch, confidence, n_samples, chunk_size, rng):
+    if branch not in ("major", "minor"):
+        raise ValueError(f"branch must be 'major' or 'minor', not {branch}")
+    rng = np.random.default_rng(rng)
+    a_s, b_s, c_s = rng.multivariate_normal(popt, pcov, size=n_samples).T
+    # per-draw constants of the stable quadratic formula in _roots, so each
+    # chunk takes a few in-place passes over one (chunk, n_samples) buffer:
+    # disc = disc0 + 4 a y,  major root = (-b/2 + half_sign * sqrt(disc)) / a
+    disc0 = b_s * b_s - 4 * a_s * c_s
+    four_a = 4 * a_s
+    half_sign = np.where(b_s >= 0, -0.5, 0.5)
+    if branch == "major":
+        half_sign /= a_s
+        half_b = -0.5 * b_s / a_s
+    else:
+        half_b = -0.5 * b_s
+
+    y_flat = y.reshape(-1)
+    sigma_flat = (
+        None
+        if peak_sigma is None
+        else np.broadcast_to(np.asarray(peak_sigma, dtype=float), y.shape).reshape(-1)
+    )
+    # draws are stored relative to the point estimate, which keeps the
+    # one-pass variance (sum of squares minus squared sum) accurate
+    value = _roots(y_flat, *popt, branch)
+    shift = np.where(np.isnan(value), 0, value)
+    q = np.array([0.5 - confidence / 2, 0.5 + confidence / 2])
+    n = y_flat.size
+    out = {k: np.empty(n) for k in ("std", "lower", "upper", "valid")}
+
+    chunk_size = max(1, min(chunk_size, n))  # no peaks: empty outputs
+    draws = np.empty((chunk_size, n_samples))
+    valid = np.empty((chunk_size, n_samples))
+    need_tmp = sigma_flat is not None or branch == "minor"
+    tmp = np.empty((chunk_size, n_samples)) if need_tmp else None
+
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        m = stop - start
+        d, ok = draws[:m], valid[:m]
+        y_chunk = y_flat[start:stop, None]
+        if sigma_flat is not None:
+            y_chunk = rng.standard_normal(out=tmp[:m])
+            y_chunk *= sigma_flat[start:stop, None]
+            y_chunk += y_flat[start:stop, None]
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            np.multiply(y_chunk, four_a, out=d)
+            d += disc0
+            # 1.0 for real roots, 0.0 for complex ones
+            np.greater_equal(d, 0, out=ok, casting="unsafe")
+            np.maximum(d, 0, out=d)
+            np.sqrt(d, out=d)
+            d *= half_sign
+            d += half_b
+            if branch == "minor":
+                np.subtract(c_s, y_chunk, out=tmp[:m])
+                np.divide(tmp[:m], d, out=d)
+            d -= shift[start:stop, None]
+
+            # moments over the valid draws, one pass each
+            d *= ok
+            n_valid = ok.sum(axis=-1)
+            s1 = d.sum(axis=-1)
+            s2 = np.einsum("ij,ij->i", d, d)
+            var = (s2 - s1 * s1 / n_valid) / (n_valid - 1)
+            out["std"][start:stop] = np.sqrt(np.maximum(var, 0))
+            out["valid"][start:stop] = n_valid / n_samples
+
+            # invalid draws become 0/0 = NaN, which sorts to the end of each row
+            d /= ok
+        d.sort(axis=-1)
+        last = np.maximum(n_valid.astype(int) - 1, 0)
+        pos = q[:, None] * last
+        lo = np.floor(pos).astype(int)
+        hi = np.minimum(lo + 1, last)
+        rows = np.arange(m)
+        v_lo, v_hi = d[rows, lo], d[rows, hi]
+        quantiles = v_lo + (pos - lo) * (v_hi - v_lo) + shift[start:stop]
+        quantiles[:, n_valid == 0] = np.nan
+        out["lower"][start:stop], out["upper"][start:stop] = quantiles
+
+    return IrradianceEstimate(
+        value=value.reshape(y.shape),
+        std=out["std"].reshape(y.shape),
+        lower=out["lower"].reshape(y.shape),
+        upper=out["upper"].reshape(y.shape),
+        confidence=confidence,
+        method="monte_carlo",
+        valid_fraction=out["valid"].reshape(y.shape),
+    )
+
+
+def infer_light_intensity_with_uncertainty(
+    deltaF_over_delta,
+    popt: np.ndarray,
+    pcov: np.ndarray,
+    method: str = "delta",
+    peak_sigma=None,
+    branch: str = "major",
+    confidence: float = 0.95,
+    n_samples: int = 1000,
+    max_chunk_elements: int = 2**17,
+    rng=None,
+) -> IrradianceEstimate:
+    """Infers irradiance for a batch of ΔF/F0 peaks, with error bars.
+
+    Parameters
+    ----------
+    deltaF_over_delta : array-like
+        Measured ΔF/F0 peak values, any shape.
+    popt : np.ndarray
+        Best-fit ``(a, b, c)`` of :func:`model_function`.
+    pcov : np.ndarray
+        Covariance of ``popt``, as returned by ``curve_fit``.
+    method : str, optional
+        ``"delta"`` for first-order (analytic) propagation, or ``"monte_carlo"``
+        to draw ``n_samples`` parameter sets from ``N(popt, pcov)``.
+        By default ``"delta"``.
+    peak_sigma : float or array-like, optional
+        Standard deviation of the measured peaks themselves, if known.
+    branch : str, optional
+        Which root of the quadratic to report; see :func:`infer_light_intensity`.
+    confidence : float, optional
+        Confidence level of the returned interval, by default 0.95.
+    n_samples : int, optional
+        Number of Monte Carlo parameter draws, by default 1000. The Monte
+        Carlo mode costs ``n_samples`` root evaluations and a sort of
+        ``n_samples`` draws per peak: about 14 s per 10⁶ peaks on one core at
+        the default. For batches that large use the delta method, or fewer
+        draws (the interval bounds' Monte Carlo error grows as
+        ``1 / sqrt(n_samples)``).
+    max_chunk_elements : int, optional
+        Caps the ``n_samples x chunk`` working arrays of the Monte Carlo mode,
+        bounding its memory use. By default 2**17 (1 MB of float64), small
+        enough for the in-place passes over them to stay in cache.
+    rng : optional
+        Seed or ``np.random.Generator`` for the Monte Carlo mode.
+
+    Returns
+    -------
+    IrradianceEstimate
+        Point estimates, standard deviations and intervals shaped like the input.
+    """
+    y = np.asarray(deltaF_over_delta, dtype=float)
+    popt = np.asarray(popt, dtype=float)
+    pcov = np.asarray(pcov, dtype=float)
+    if not 0 < confidence < 1:
+        raise ValueError(f"confidence must be in (0, 1), not {confidence}")
+
+    if method == "delta":
+        with instrumentation.timed("inversion", method=method, n=y.size):
+            return _delta_method(y, popt, pcov, peak_sigma, branch, confidence)
+    elif method == "monte_carlo":
+        chunk_size = max(1, max_chunk_elements // n_samples)
+        with instrumentation.timed(
+            "inversion", method=method, n=y.size, n_samples=n_samples
+        ):
+            return _monte_carlo(
+                y, popt, pcov, peak_sigma, branch, confidence, n_samples,
+                chunk_size, rng,
+            )  # fmt: skip
+    raise ValueError(f"method must be 'delta' or 'monte_carlo', not {method}")
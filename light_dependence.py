@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import numpy as np
+from attrs import define, field
+from scipy.optimize import curve_fit
+
+import instrumentation
+
+
+@define(eq=False)
+class ExcitationModel:
+    """Base class for excitation models."""
+
+    pass
+
+
+@define(eq=False)
+class LightExcitation(ExcitationModel):
+    """Models light-dependent excitation using a Hill function.
+
+    ``Fitted Light Dependent Curves Updated.py`` imports it from here.
+    """
+
+    A: float = field(init=False)
+    Kd: float = field(init=False)
+    n: float = field(init=False)
+    baseline: float = field(default=0.0, init=False)
+    pcov: np.ndarray = field(default=None, init=False, repr=False)
+    """covariance of ``(A, Kd, n, baseline)`` from the last fit"""
+
+    @staticmethod
+    def hill_function(Irr_pre, A, Kd, n, baseline):
+        return baseline + A * (Irr_pre**n) / ((Kd**n) + (Irr_pre**n))
+
+    def fit_excitation(self, light_intensities, responses):
+        # Fit Hill function to the light intensity vs response data
+        with instrumentation.timed("fit", model=type(self).__name__) as metrics:
+            popt, self.pcov, info, _, _ = curve_fit(
+                self.hill_function,
+                light_intensities,
+                responses,
+                maxfev=10000,
+                p0=[1.0, 1.0, 1.0, 0.0],
+                full_output=True,
+            )
+            metrics["nfev"] = int(info["nfev"])
+        self.A, self.Kd, self.n, self.baseline = popt
+
+    def __call__(self, Irr_pre):
+        return self.hill_function(Irr_pre, self.A, self.Kd, self.n, self.baseline)
+
+
+def fit_light_dependence_curves(
+    light_intensities: np.ndarray, responses_dict: dict[str, np.ndarray]
+) -> dict[str, LightExcitation]:
+    """Fit light dependence curves for multiple indicators, without plotting.
+
+    Parameters
+    ----------
+    light_intensities : np.ndarray
+        Array of light intensity values.
+    responses_dict : dict
+        Dictionary where keys are indicator names and values are arrays of responses to light intensities.
+
+    Returns
+    -------
+    dict[str, LightExcitation]
+        Fitted excitation model for each indicator.
+    """
+    fitted = {}
+    for indicator_name, responses in responses_dict.items():
+        exc_model = LightExcitation()
+        exc_model.fit_excitation(light_intensities, responses)
+        fitted[indicator_name] = exc_model
+    return fitted
@@ -0,0 +1,241 @@
+"""Two-photon-like imaging movies synthesized from per-neuron ΔF/F.
+
+``GECI.get_state()`` gives one ΔF/F value per neuron. Stacking those per
+imaging frame, e.g. ``np.concatenate(list(geci.get_state().values()))``,
+gives the ``(n_frames, n_neurons)`` array :func:`synthesize_movie` turns into
+pixel frames:
+
+    F = baseline * (1 + ΔF/F + sigma_noise * ε),   ε ~ N(0, 1) per neuron and frame
+    frame = footprints @ F
+
+``footprints`` is a sparse ``(n_pixels, n_neurons)`` matrix (see
+:class:`Footprints`), so each chunk of frames costs one sparse-dense product.
+Chunks are computed in parallel worker processes and written straight into a
+memory-mapped ``.npy`` file, so the movie is never held in RAM; a 512x512,
+10⁴-neuron, 3·10⁴-frame movie needs only ``n_workers`` chunks of memory.
+Noise for each chunk is seeded from ``(seed, chunk index)``, so the movie
+doesn't depend on the number of workers.
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+from attrs import define
+from scipy import sparse
+
+
+@define(eq=False)
+class Footprints:
+    """Sparse spatial footprints of neurons in an imaging field"""
+
+    matrix: sparse.csr_matrix
+    """``(height * width, n_neurons)`` pixel weights"""
+    shape: tuple[int, int]
+    """``(height, width)`` of a frame"""
+
+    @property
+    def n_neurons(self) -> int:
+        return self.matrix.shape[1]
+
+    @classmethod
+    def gaussian(
+        cls,
+        centers_px: np.ndarray,
+        shape: tuple[int, int],
+        sigma_px: float = 2.0,
+        radius_px: float | None = None,
+        dtype=np.float32,
+    ) -> Footprints:
+        """Isotropic Gaussian footprints with peak weight 1.
+
+        Parameters
+        ----------
+        centers_px : np.ndarray
+            ``(n_neurons, 2)`` (row, column) centers, in pixels.
+        shape : tuple[int, int]
+            Frame ``(height, width)``.
+        sigma_px : float, optional
+            Gaussian width in pixels, by default 2.
+        radius_px : float, optional
+            Footprints are truncated at this distance; by default ``3 * sigma_px``.
+        """
+        centers = np.asarray(centers_px, dtype=float).reshape(-1, 2)
+        height, width = shape
+        if radius_px is None:
+            radius_px = 3 * sigma_px
+        r = int(np.ceil(radius_px))
+        dy, dx = np.mgrid[-r : r + 1, -r : r + 1].reshape(2, -1)
+
+        # all (neuron, offset) pairs at once, relative to the nearest pixel
+        base = np.rint(centers).astype(int)
+        rows = base[:, :1] + dy
+        cols = base[:, 1:] + dx
+        d2 = (rows - centers[:, :1]) ** 2 + (cols - centers[:, 1:]) ** 2
+        keep = (
+            (d2 <= radius_px**2)
+            & (rows >= 0) & (rows < height)
+            & (cols >= 0) & (cols < width)
+        )  # fmt: skip
+        neuron = np.broadcast_to(np.arange(len(centers))[:, None], keep.shape)
+        matrix = sparse.csr_matrix(
+            (
+                np.exp(-d2[keep] / (2 * sigma_px**2)).astype(dtype),
+                (rows[keep] * width + cols[keep], neuron[keep]),
+            ),
+            shape=(height * width, len(centers)),
+        )
+        return cls(matrix, (height, width))
+
+    @classmethod
+    def random(
+        cls,
+        n_neurons: int,
+        shape: tuple[int, int],
+        sigma_px: float = 2.0,
+        rng=None,
+        **kwargs,
+    ) -> Footprints:
+        """Gaussian footprints at uniformly random positions in the frame"""
+        rng = np.random.default_rng(rng)
+        centers = rng.uniform((0, 0), shape, size=(n_neurons, 2))
+        return cls.gaussian(centers, shape, sigma_px, **kwargs)
+
+    def project(self, fluorescence: np.ndarray) -> np.ndarray:
+        """``(n_frames, n_neurons)`` fluorescence to ``(n_frames, height, width)`` frames"""
+        fluorescence = np.atleast_2d(fluorescence)
+        frames = (self.matrix @ fluorescence.T).T
+        return frames.reshape(len(fluorescence), *self.shape)
+
+
+def _fluorescence(dff, baseline, sigma_noise, rng, dtype) -> np.ndarray:
+    dff = np.asarray(dff, dtype=dtype)
+    signal = 1 + dff
+    if np.any(sigma_noise):
+        noise = rng.standard_normal(dff.shape, dtype=np.float32).astype(dtype, copy=False)
+        signal += noise * np.asarray(sigma_noise, dtype=dtype)
+    return signal * np.asarray(baseline, dtype=dtype)
+
+
+# per-process state, so the footprints are sent once per worker, not per chunk
+_worker: dict = {}
+
+
+def _init_worker(footprints, out_path, dff_path, baseline, sigma_noise, seed):
+    _worker.update(
+        footprints=footprints,
+        out=np.load(out_path, mmap_mode="r+"),
+        dff=np.load(dff_path, mmap_mode="r") if dff_path is not None else None,
+        baseline=baseline,
+        sigma_noise=sigma_noise,
+        seed=seed,
+    )
+
+
+def _write_chunk(chunk: int, start: int, stop: int, dff=None) -> int:
+    out = _worker["out"]
+    if dff is None:
+        dff = _worker["dff"][start:stop]
+    F = _fluorescence(
+        dff,
+        _worker["baseline"],
+        _worker["sigma_noise"],
+        np.random.default_rng([_worker["seed"], chunk]),
+        out.dtype,
+    )
+    out[start:stop] = _worker["footprints"].project(F)
+    return stop - start
+
+
+def synthesize_movie(
+    dff: np.ndarray | str | os.PathLike,
+    footprints: Footprints,
+    path: str | os.PathLike,
+    baseline: float | np.ndarray = 1.0,
+    sigma_noise: float | np.ndarray = 0.0,
+    chunk_frames: int = 64,
+    n_workers: int | None = None,
+    dtype=np.float32,
+    seed=0,
+) -> np.memmap:
+    """Renders per-neuron ΔF/F into a movie file, chunk by chunk.
+
+    Parameters
+    ----------
+    dff : np.ndarray | str | os.PathLike
+        ``(n_frames, n_neurons)`` ΔF/F, or a ``.npy`` file holding it, which
+        workers then read by memory map instead of receiving it by pickle.
+    footprints : Footprints
+        Spatial footprints with ``n_neurons`` columns.
+    path : str | os.PathLike
+        Output ``.npy`` file of shape ``(n_frames, height, width)``.
+    baseline : float or np.ndarray, optional
+        Resting fluorescence per neuron (scalar or ``(n_neurons,)``), by default 1.
+    sigma_noise : float or np.ndarray, optional
+        ΔF/F noise standard deviation, e.g. the sensor's ``sigma_noise``; by default 0.
+    chunk_frames : int, optional
+        Frames per chunk; peak memory is about ``n_workers`` chunks.
+    n_workers : int, optional
+        Worker processes; by default ``os.cpu_count()``. 1 runs in-process.
+    dtype : optional
+        Movie dtype, by default float32.
+    seed : optional
+        Seed for the noise.
+
+    Returns
+    -------
+    np.memmap
+        The finished movie, opened read-only.
+    """
+    dff_path = None
+    if isinstance(dff, (str, os.PathLike)):
+        dff_path = dff
+        dff = np.load(dff_path, mmap_mode="r")
+    n_frames, n_neurons = dff.shape
+    if n_neurons != footprints.n_neurons:
+        raise ValueError(
+            f"dff has {n_neurons} neurons but footprints have {footprints.n_neurons}"
+        )
+    path = Path(path)
+    out = np.lib.format.open_memmap(
+        path, mode="w+", dtype=dtype, shape=(n_frames, *footprints.shape)
+    )
+    del out  # header written; workers open their own maps
+
+    chunks = [
+        (k, start, min(start + chunk_frames, n_frames))
+        for k, start in enumerate(range(0, n_frames, chunk_frames))
+    ]
+    initargs = (footprints, path, dff_path, baseline, sigma_noise, seed)
+
+    def task_args(chunk):
+        k, start, stop = chunk
+        return chunk if dff_path is not None else (k, start, stop, dff[start:stop])
+
+    n_workers = n_workers or os.cpu_count()
+    if n_workers <= 1:
+        _init_worker(*initargs)
+        try:
+            for chunk in chunks:
+                _write_chunk(*task_args(chunk))
+            _worker["out"].flush()
+        finally:
+            _worker.clear()
+    else:
+        with ProcessPoolExecutor(
+            max_workers=n_workers, initializer=_init_worker, initargs=initargs
+        ) as pool:
+            # keep a bounded number of chunks in flight to bound memory
+            pending, todo = set(), iter(chunks)
+            for chunk in todo:
+                pending.add(pool.submit(_write_chunk, *task_args(chunk)))
+                if len(pending) >= 2 * n_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+            for future in pending:
+                future.result()
+    return np.load(path, mmap_mode="r")
@@ -0,0 +1,295 @@
+"""Multi-start fitting of Bansal opsin kinetics to voltage-clamp recordings.
+
+Several opsins in ``new add ons to opsin_library.py`` carry parameters copied
+from papers ("(fix this)"). :class:`KineticsFitter` fits any subset of them
+(by default ``Gd1``, ``Gd2``, ``Gr``, ``ka1``, ``ka2``, ``Gf0``, ``Gb0``,
+``kf``, ``kb``, ``phim``, ``p``, ``q``, ``g0``) to our own photocurrent
+recordings, using :class:`photocurrent.PhotocurrentEngine` as the forward
+model:
+
+- all recordings, and every finite-difference perturbation of the Jacobian,
+  are simulated together in one batched engine run;
+- parameters are fit in log space within bounds, by ``least_squares``;
+- :func:`fit_multistart` spreads random restarts over a process pool (the
+  fitter, recordings included, is sent once per worker, not per restart) and
+  appends each finished restart to a JSON-lines checkpoint, so an
+  interrupted job resumes where it stopped.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Mapping, Sequence
+
+import numpy as np
+from attrs import define, field
+from scipy.optimize import least_squares
+
+import instrumentation
+from photocurrent import PhotocurrentEngine, is_four_state
+
+FOUR_STATE_FIT_PARAMS = (
+    "Gd1", "Gd2", "Gr", "ka1", "ka2", "Gf0", "Gb0", "kf", "kb", "phim", "p", "q", "g0"
+)  # fmt: skip
+PUMP_FIT_PARAMS = ("Gd", "Gr", "ka", "phim", "p", "g0")
+
+DEFAULT_BOUNDS: dict[str, tuple[float, float]] = {
+    **{k: (1e-6, 10.0) for k in ("Gd", "Gd1", "Gd2", "Gr", "Gf0", "Gb0", "kf", "kb")},
+    **{k: (1e-4, 100.0) for k in ("ka", "ka1", "ka2")},
+    "phim": (1e13, 1e20),
+    "p": (0.1, 3.0),
+    "q": (0.1, 3.0),
+    "gamma": (1e-3, 1.0),
+    "g0": (1e-2, 1e3),
+}
+"""fitting bounds in the registry's units (1/ms, photons/mm²/s, nS)"""
+
+
+@define(eq=False)
+class Recording:
+    """One voltage-clamp photocurrent recording under a known light protocol"""
+
+    phi: np.ndarray = field(converter=lambda a: np.asarray(a, dtype=float))
+    """photon flux at each sample (photons/mm²/s)"""
+    current: np.ndarray = field(converter=lambda a: np.asarray(a, dtype=float))
+    """measured photocurrent at each sample (pA), positive depolarizing as in cleo"""
+    V: float = -70.0
+    """holding potential (mV)"""
+    name: str = ""
+
+    @current.validator
+    def _check_length(self, attribute, value):
+        if value.shape != self.phi.shape:
+            raise ValueError("phi and current must have the same shape")
+
+
+@define(eq=False)
+class KineticsFitter:
+    """Least-squares fit of one opsin's kinetics to a set of recordings.
+
+    All recordings share one parameter set and must be sampled at :attr:`dt`.
+    """
+
+    recordings: Sequence[Recording]
+    base_params: Mapping[str, float] = field(converter=dict)
+    """starting/fixed parameters, e.g. ``REGISTRY.params("ChRmine")``"""
+    dt: float
+    """sampling interval of the recordings (ms)"""
+    fit_params: Sequence[str] = field(default=None)
+    """names of the parameters to fit; by default all kinetic ones"""
+    bounds: Mapping[str, tuple[float, float]] = field(
+        factory=lambda: DEFAULT_BOUNDS, converter=dict
+    )
+    rel_step: float = 1e-4
+    """relative finite-difference step for the Jacobian"""
+
+    _phi: np.ndarray = field(init=False, repr=False)
+    _current: np.ndarray = field(init=False, repr=False)
+    _mask: np.ndarray = field(init=False, repr=False)
+    _V: np.ndarray = field(init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        if self.fit_params is None:
+            four_state = is_four_state(self.base_params)
+            self.fit_params = FOUR_STATE_FIT_PARAMS if four_state else PUMP_FIT_PARAMS
+        self.fit_params = tuple(self.fit_params)
+        n_max = max(len(r.phi) for r in self.recordings)
+        n_rec = len(self.recordings)
+        self._phi = np.zeros((n_rec, n_max))
+        self._current = np.zeros((n_rec, n_max))
+        self._mask = np.zeros((n_rec, n_max), dtype=bool)
+        for k, r in enumerate(self.recordings):
+            self._phi[k, : len(r.phi)] = r.phi
+            self._current[k, : len(r.phi)] = r.current
+            self._mask[k, : len(r.phi)] = True
+        self._V = np.array([r.V for r in self.recordings])
+
+    @property
+    def log_bounds(self) -> tuple[np.ndarray, np.ndarray]:
+        lo, hi = np.log([self.bounds[k] for k in self.fit_params]).T
+        return lo, hi
+
+    def to_params(self, log_theta: np.ndarray) -> dict[str, float]:
+        """Full parameter dict for one log-space parameter vector"""
+        params = dict(self.base_params)
+        params.update(zip(self.fit_params, np.exp(log_theta).tolist()))
+        return params
+
+    def simulate(self, log_thetas: np.ndarray) -> np.ndarray:
+        """Batched forward model: ``(n_candidates, n_params)`` log-parameters
+        to ``(n_candidates, n_recordings, n_samples)`` photocurrents (pA)."""
+        log_thetas = np.atleast_2d(log_thetas)
+        n_cand, n_rec = len(log_thetas), len(self.recordings)
+        engine = PhotocurrentEngine([self.to_params(th) for th in log_thetas], self.dt)
+        result = engine.run(
+            np.repeat(np.arange(n_cand), n_rec),
+            np.tile(self._phi, (n_cand, 1)),
+            V=np.tile(self._V, n_cand),
+        )
+        return result.current.reshape(n_cand, n_rec, -1)
+
+    def _residuals(self, simulated: np.ndarray) -> np.ndarray:
+        return (simulated - self._current)[..., self._mask]
+
+    def residuals(self, log_theta: np.ndarray) -> np.ndarray:
+        return self._residuals(self.simulate(log_theta))[0]
+
+    def jacobian(self, log_theta: np.ndarray) -> np.ndarray:
+        """Forward-difference Jacobian, all perturbations in one engine run"""
+        h = self.rel_step * np.maximum(1.0, np.abs(log_theta))
+        thetas = np.vstack([log_theta, log_theta + np.diag(h)])
+        res = self._residuals(self.simulate(thetas))
+        return ((res[1:] - res[0]) / h[:, None]).T
+
+    def fit(self, log_theta0: np.ndarray, **lsq_kwargs) -> dict:
+        """Runs one local fit from ``log_theta0``; returns a JSON-able summary"""
+        lo, hi = self.log_bounds
+        x0 = np.clip(log_theta0, lo + 1e-9, hi - 1e-9)
+        lsq_kwargs = {"max_nfev": 200, **lsq_kwargs}
+        with instrumentation.timed("fit", model=type(self).__name__) as metrics:
+            res = least_squares(
+                self.residuals, x0, jac=self.jacobian, bounds=(lo, hi), **lsq_kwargs
+            )
+            metrics["nfev"] = int(res.nfev)
+        return {
+            "cost": float(res.cost),
+            "rmse": float(np.sqrt(2 * res.cost / max(1, len(res.fun)))),
+            "params": dict(zip(self.fit_params, np.exp(res.x).tolist())),
+            "success": bool(res.success),
+            "nfev": int(res.nfev),
+            "message": res.message,
+        }
+
+    def random_starts(self, n_starts: int, seed=0) -> np.ndarray:
+        """Log-uniform starting points within bounds; the first is ``base_params``"""
+        lo, hi = self.log_bounds
+        starts = np.random.default_rng(seed).uniform(lo, hi, (n_starts, len(lo)))
+        if n_starts > 0:
+            with np.errstate(divide="ignore"):  # e.g. ChRmine's kb = 0
+                base = np.log([self.base_params[k] for k in self.fit_params])
+            starts[0] = np.clip(base, lo, hi)
+        return starts
+
+
+def _fit_start(fitter: KineticsFitter, start: int, log_theta0: np.ndarray, lsq_kwargs):
+    try:
+        result = fitter.fit(log_theta0, **lsq_kwargs)
+    except Exception as e:  # a diverging start shouldn't sink the others
+        result = {
+            "cost": float("inf"),
+            "params": None,
+            "success": False,
+            "message": repr(e),
+        }
+    result["start"] = start
+    return result
+
+
+# per-process state, so the fitter is sent once per worker, not per restart
+_worker: dict = {}
+
+
+def _init_worker(fitter: KineticsFitter):
+    _worker["fitter"] = fitter
+
+
+def _fit_start_in_worker(start: int, log_theta0: np.ndarray, lsq_kwargs):
+    return _fit_start(_worker["fitter"], start, log_theta0, lsq_kwargs)
+
+
+@define(eq=False)
+class MultiStartResult:
+    """All restarts of :func:`fit_multistart`, best first"""
+
+    fits: list[dict]
+
+    @property
+    def best(self) -> dict:
+        return self.fits[0]
+
+    def best_params(self, base_params: Mapping[str, float]) -> dict[str, float]:
+        """``base_params`` updated with the best fit"""
+        if not self.fits or self.best.get("params") is None:
+            messages = {r.get("message") for r in self.fits}
+            raise ValueError(f"every start failed: {messages}")
+        return {**base_params, **self.best["params"]}
+
+
+def fit_multistart(
+    fitter: KineticsFitter,
+    n_starts: int = 64,
+    n_workers: int | None = None,
+    checkpoint: str | os.PathLike | None = None,
+    seed=0,
+    **lsq_kwargs,
+) -> MultiStartResult:
+    """Fits from many random starts in parallel, checkpointing as they finish.
+
+    Parameters
+    ----------
+    fitter : KineticsFitter
+    n_starts : int, optional
+        Number of restarts (including one from ``fitter.base_params``).
+    n_workers : int, optional
+        Worker processes; by default ``os.cpu_count()``. 1 runs in-process.
+    checkpoint : str | os.PathLike, optional
+        JSON-lines file with one line per finished restart. Restarts already
+        in it are not rerun, so the same call resumes an interrupted job.
+        Starts are drawn from ``seed``; keep it fixed when resuming.
+    seed : optional
+        Seed for the random starts.
+    **lsq_kwargs
+        Passed on to ``scipy.optimize.least_squares``.
+
+    Returns
+    -------
+    MultiStartResult
+    """
+    starts = fitter.random_starts(n_starts, seed)
+    done = {}
+    if checkpoint is not None and Path(checkpoint).exists():
+        with open(checkpoint) as f:
+            for line in f:
+                if line.strip():
+                    result = json.loads(line)
+                    done[result["start"]] = result
+    todo = [i for i in range(n_starts) if i not in done]
+
+    def record(result):
+        done[result["start"]] = result
+        if checkpoint is not None:
+            with open(checkpoint, "a") as f:
+                f.write(json.dumps(result) + "\n")
+
+    n_workers = n_workers or os.cpu_count()
+    if n_workers <= 1:
+        for i in todo:
+            record(_fit_start(fitter, i, starts[i], lsq_kwargs))
+    else:
+        metrics = instrumentation.enabled()
+        with ProcessPoolExecutor(
+            max_workers=n_workers, initializer=_init_worker, initargs=(fitter,)
+        ) as pool:
+            futures = [
+                pool.submit(
+                    instrumentation.call_recorded,
+                    metrics,
+                    _fit_start_in_worker,
+                    i,
+                    starts[i],
+                    lsq_kwargs,
+                )
+                for i in todo
+            ]
+            for future in as_completed(futures):
+                result, worker_metrics = future.result()
+                instrumentation.merge(worker_metrics)
+                record(result)
+
+    fits = sorted(
+        (done[i] for i in range(n_starts) if i in done), key=lambda r: r["cost"]
+    )
+    return MultiStartResult(fits)
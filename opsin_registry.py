@@ -0,0 +1,249 @@
+"""Unit-aware registry of opsin parameters, with lazy model construction.
+
+Collects the parameters scattered over ``new add ons to opsin_library.py`` --
+the eager factories (``jaws``, ``np_hr``, ``chr2``, ``reachr``, ``chrimsonr``)
+and the unitless ``*_params`` dicts -- into one structured NumPy table.
+
+- Every field has a fixed unit (:data:`UNITS`); values are stored as plain
+  floats in those units, NaN where a field doesn't apply to a model.
+- ``g0`` has per-preparation variants (``"default"``, ``"photocurrent"``,
+  ``"hippocampal_neurons"``, ``"RGNs"``).
+- The ``*_params`` dicts' ``k1``/``k2`` are stored as ``ka1``/``ka2``.
+- Importing this module imports neither Brian2 nor cleo; a model object is only
+  built by :meth:`OpsinSpec.model` / :meth:`OpsinSpec.inject`.
+"""
+
+from __future__ import annotations
+
+from types import MappingProxyType
+from typing import Mapping, Sequence
+
+import numpy as np
+from attrs import define, field
+
+UNITS: dict[str, str] = {
+    "Gd": "1/ms",
+    "Gd1": "1/ms",
+    "Gd2": "1/ms",
+    "Gr": "1/ms",
+    "ka": "1/ms",
+    "ka1": "1/ms",
+    "ka2": "1/ms",
+    "Gf0": "1/ms",
+    "Gb0": "1/ms",
+    "kf": "1/ms",
+    "kb": "1/ms",
+    "gamma": "1",
+    "p": "1",
+    "q": "1",
+    "phim": "1/mm2/second",
+    "E": "mV",
+    "a": "mM/pcoulomb",
+    "b": "1",
+}
+"""unit of each numeric field, as a Brian2 expression"""
+
+FIELDS = tuple(UNITS)
+PREPARATIONS = ("default", "photocurrent", "hippocampal_neurons", "RGNs")
+G0_UNIT = "nsiemens"
+
+# fmt: off
+_FOUR_STATE = ("Gd1", "Gd2", "Gr", "ka1", "ka2", "Gf0", "Gb0", "kf", "kb", "gamma", "p", "q", "phim", "E")
+_PUMP = ("Gd", "Gr", "ka", "p", "q", "phim", "E", "a", "b")
+
+# name:        (model, values in _FOUR_STATE/_PUMP order, {preparation: g0}, spectrum, source)
+_OPSINS = {
+    "Jaws": ("pump", (0.167, 0.05, 1, 0.8, 1, 0.95e18, -400, 0.02e-2, 6.5),
+             {"default": 12.6}, [(593, 1)], "Bansal et al., 2020"),
+    "NpHR": ("pump", (0.1099, 0.05, 0.005, 0.5, 0.2, 1.5e18, -400, 0.02e-2, 5),
+             {"default": 17.7}, [(593, 1)], "Bansal et al., 2020"),
+    "ChR2": ("four_state", (0.09, 0.01, 0.5e-3, 3, 0.18, 0.015, 0.005, 0.03, 0.003, 0.05, 1, 1, 4e16, 0),
+             {"default": 5.9}, [], "Bansal et al., 2021"),
+    "ReaChR": ("four_state", (7.7e-3, 1.25e-3, 3.33e-5, 1.2, 0.01, 0.0005, 0.0005, 0.012, 0.001, 0.05, 1, 1, 5e17, 7),
+               {"default": 14.28}, [], "Bansal et al., 2021"),
+    "ChrimsonR": ("four_state", (0.067, 0.01, 0.5e-3, 6, 0.1, 0.02, 0.05, 0.1, 0.001, 0.05, 0.6, 1, 20e17, 0),
+                  {"default": 12.25}, [], "Bansal et al., 2021"),
+    "CsChrimson": ("four_state", (0.033, 0.017, 5e-6, 3, 0.04, 0.005, 0.01, 0.01, 0.6, 0.05, 1, 1, 6e16, -10),
+                   {"photocurrent": 18.48, "hippocampal_neurons": 1.2, "RGNs": 0.37}, [], "Bansal et al., 2021"),
+    "bReaChES": ("four_state", (0.025, 0.01, 3.3e-5, 0.4, 0.01, 0.002, 0.002, 0.01, 0.04, 0.05, 1, 1, 6e15, 10),
+                 {"photocurrent": 36.5, "hippocampal_neurons": 0.7, "RGNs": 0.73}, [], "Bansal et al., 2021"),
+    "ChRmine": ("four_state", (0.02, 0.013, 5.9e-4, 0.2, 0.01, 0.0027, 0.0005, 0.001, 0, 0.05, 0.8, 1, 2.1e15, 5.6),
+                {"photocurrent": 110, "hippocampal_neurons": 1.9, "RGNs": 2.2}, [], "Bansal et al., 2021"),
+}
+# fmt: on
+
+_CLEO_NAMES = {"ka1": "k1", "ka2": "k2", "Gr": "Gr0"}
+"""four-state field names that differ in cleo's BansalFourStateOpsin"""
+
+
+def _brian2_units() -> dict:
+    """Brian2 quantity for each unit string; imports Brian2 on first use"""
+    from brian2 import mM, ms, mm2, mV, nsiemens, pcoulomb, second
+
+    return {
+        "1": 1,
+        "1/ms": 1 / ms,
+        "1/mm2/second": 1 / mm2 / second,
+        "mV": mV,
+        "mM/pcoulomb": mM / pcoulomb,
+        "nsiemens": nsiemens,
+    }
+
+
+@define(eq=False)
+class OpsinSpec:
+    """Handle to one registry entry; builds the cleo model only on demand"""
+
+    registry: OpsinRegistry = field(repr=False)
+    name: str
+    preparation: str = "default"
+    _model: object = field(default=None, init=False, repr=False)
+
+    @property
+    def params(self) -> Mapping[str, float]:
+        """Unitless parameters (see :data:`UNITS`), including ``g0`` (nS)"""
+        return self.registry.params(self.name, self.preparation)
+
+    def model(self, **overrides):
+        """Builds (once) the cleo opsin model with Brian2 units.
+
+        ``overrides`` (with units) are applied on top of the registry values;
+        passing any forces a fresh model. Parameters can still be changed
+        after this but *before injection*, as with the original factories.
+        """
+        if self._model is not None and not overrides:
+            return self._model
+        from cleo.opto import BansalFourStateOpsin, BansalThreeStatePump
+
+        units = _brian2_units()
+        kwargs = {
+            key: value * units[self.registry.unit(key)]
+            for key, value in self.params.items()
+        }
+        if self.registry.is_four_state(self.name):
+            cls = BansalFourStateOpsin
+            kwargs = {_CLEO_NAMES.get(k, k): v for k, v in kwargs.items()}
+        else:
+            cls = BansalThreeStatePump
+        kwargs.update(overrides)
+        model = cls(name=self.name, spectrum=self.registry.spectrum(self.name), **kwargs)
+        if not overrides:
+            self._model = model
+        return model
+
+    def inject(self, sim, *neuron_groups, **kwparams):
+        """Builds the model if needed and injects it with ``sim.inject``"""
+        model = self.model()
+        sim.inject(model, *neuron_groups, **kwparams)
+        return model
+
+
+class OpsinRegistry:
+    """Structured, read-only table of opsin parameters.
+
+    :attr:`table` is a structured array with one row per opsin and one float
+    field per entry of :data:`UNITS`; :attr:`g0` is an
+    ``(n_opsins, n_preparations)`` array in nS. Per-opsin parameter mappings
+    are built once, so repeated :meth:`params` look-ups allocate nothing.
+    """
+
+    def __init__(self, entries: Mapping[str, tuple] = _OPSINS):
+        self.names = list(entries)
+        self._index = {name: i for i, name in enumerate(self.names)}
+        dtype = [(f, "f8") for f in FIELDS] + [("four_state", "?")]
+        self.table = np.zeros(len(entries), dtype=dtype)
+        self.g0 = np.full((len(entries), len(PREPARATIONS)), np.nan)
+        self._spectra = {}
+        self._sources = {}
+        for i, (name, (kind, values, g0s, spectrum, source)) in enumerate(
+            entries.items()
+        ):
+            for f in FIELDS:
+                self.table[f][i] = np.nan
+            keys = _FOUR_STATE if kind == "four_state" else _PUMP
+            for key, value in zip(keys, values):
+                self.table[key][i] = value
+            self.table["four_state"][i] = kind == "four_state"
+            for prep, g0 in g0s.items():
+                self.g0[i, PREPARATIONS.index(prep)] = g0
+            if np.isnan(self.g0[i, 0]):
+                # no default given: papers' photocurrent fits are the closest
+                self.g0[i, 0] = self.g0[i, PREPARATIONS.index("photocurrent")]
+            self._spectra[name] = tuple(spectrum)
+            self._sources[name] = source
+        self.table.flags.writeable = False
+        self.g0.flags.writeable = False
+
+        self._params = {}
+        for name, i in self._index.items():
+            base = {f: float(self.table[f][i]) for f in FIELDS}
+            base = {k: v for k, v in base.items() if not np.isnan(v)}
+            for j, prep in enumerate(PREPARATIONS):
+                if not np.isnan(self.g0[i, j]):
+                    self._params[name, prep] = MappingProxyType(
+                        {**base, "g0": float(self.g0[i, j])}
+                    )
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._index
+
+    def index(self, names: str | Sequence[str]) -> int | np.ndarray:
+        """Row index (or indices) of the given opsin name(s)"""
+        if isinstance(names, str):
+            return self._index[names]
+        return np.array([self._index[n] for n in names], dtype=int)
+
+    def params(self, name: str, preparation: str = "default") -> Mapping[str, float]:
+        """Read-only unitless parameters of one opsin, ``g0`` for ``preparation``.
+
+        Only fields used by the opsin's model are present. The same mapping
+        object is returned on every call."""
+        try:
+            return self._params[name, preparation]
+        except KeyError:
+            if name not in self._index:
+                raise KeyError(f"unknown opsin {name!r}") from None
+            raise KeyError(f"no g0 for {name} in preparation {preparation!r}") from None
+
+    def column(self, field_name: str, names: Sequence[str] | None = None) -> np.ndarray:
+        """Values of one field across opsins (a view when ``names`` is None).
+
+        ``field_name`` may be any entry of :data:`UNITS`, ``"four_state"``, or
+        ``"g0"`` / ``"g0_<preparation>"``."""
+        if field_name == "g0" or field_name.startswith("g0_"):
+            prep = field_name[3:] or "default"
+            values = self.g0[:, PREPARATIONS.index(prep)]
+        else:
+            values = self.table[field_name]
+        return values if names is None else values[self.index(names)]
+
+    def unit(self, field_name: str) -> str:
+        """Unit of a field, as a Brian2 expression"""
+        return G0_UNIT if field_name.startswith("g0") else UNITS[field_name]
+
+    def is_four_state(self, name: str) -> bool:
+        return bool(self.table["four_state"][self._index[name]])
+
+    def spectrum(self, name: str) -> list[tuple[float, float]]:
+        """Action spectrum as ``[(wavelength, value), ...]``"""
+        return list(self._spectra[name])
+
+    def spectra(self) -> dict[str, list[tuple[float, float]]]:
+        """All action spectra, e.g. for :meth:`spectra.SpectrumTable.from_spectra`"""
+        return {name: list(s) for name, s in self._spectra.items()}
+
+    def source(self, name: str) -> str:
+        """Where the parameters come from"""
+        return self._sources[name]
+
+    def spec(self, name: str, preparation: str = "default") -> OpsinSpec:
+        """Lazy handle that builds the model when it's injected"""
+        self.params(name, preparation)  # validate now rather than at injection
+        return OpsinSpec(self, name, preparation)
+
+
+REGISTRY = OpsinRegistry()
+"""registry of all opsins from ``new add ons to opsin_library.py``"""
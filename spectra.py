@@ -0,0 +1,175 @@
+"""Dense, precomputed action/excitation spectrum tables.
+
+Opsins (``spectrum``) and sensors (``Sensor.exc_spectrum``) describe spectra as
+short lists of ``(wavelength, value)`` tuples. A :class:`SpectrumTable`
+resamples any number of them once onto a shared, uniform wavelength grid and
+keeps them as one contiguous ``(n_spectra, n_wavelengths)`` array, so that
+
+- looking up many wavelengths is a vectorized linear interpolation, and
+- integrating broadband light sources against every spectrum is one matrix
+  multiply, ``(n_spectra, n_grid) @ (n_grid, n_sources)``.
+"""
+
+from __future__ import annotations
+
+from typing import Iterable, Sequence
+
+import numpy as np
+from attrs import define, field
+
+DEFAULT_GRID = np.arange(300.0, 1301.0, 1.0)
+"""1 nm grid from 300 to 1300 nm, wide enough for 1P and 2P excitation"""
+
+
+def resample_spectrum(
+    spectrum: Sequence[tuple[float, float]], grid: np.ndarray = DEFAULT_GRID
+) -> np.ndarray:
+    """Linearly interpolates a ``[(wavelength, value), ...]`` list onto ``grid``.
+
+    Values are 0 outside the measured range. An empty spectrum, or a single
+    point (e.g. ``[(593, 1)]``, which has no shape to interpolate), gives NaN
+    everywhere, so missing data can't pass for no activation.
+    :class:`SpectrumTable` still evaluates single points at their own wavelength.
+    """
+    if len(spectrum) <= 1:
+        return np.full(len(grid), np.nan)
+    wavelengths, values = np.asarray(sorted(spectrum), dtype=float).T
+    return np.interp(grid, wavelengths, values, left=0, right=0)
+
+
+@define(eq=False)
+class SpectrumTable:
+    """Spectra of many opsins/sensors resampled onto one uniform grid"""
+
+    names: list[str]
+    grid: np.ndarray = field(converter=lambda a: np.asarray(a, dtype=float))
+    """uniformly spaced wavelengths (nm)"""
+    values: np.ndarray = field(
+        converter=lambda a: np.ascontiguousarray(a, dtype=float)
+    )
+    """``(len(names), len(grid))`` spectrum values"""
+    points: dict[int, tuple[float, float]] = field(factory=dict)
+    """``{row: (wavelength, value)}`` for single-point spectra, whose rows in
+    :attr:`values` are NaN. They are known only at that wavelength: exact there
+    in :meth:`__call__`, NaN at other wavelengths and for broadband sources."""
+
+    @grid.validator
+    def _check_grid(self, attribute, value):
+        steps = np.diff(value)
+        if len(value) < 2 or not np.allclose(steps, steps[0]) or steps[0] <= 0:
+            raise ValueError("grid must be uniformly spaced and increasing")
+
+    @property
+    def step(self) -> float:
+        """grid spacing (nm)"""
+        return self.grid[1] - self.grid[0]
+
+    @classmethod
+    def from_spectra(
+        cls,
+        spectra: dict[str, Sequence[tuple[float, float]]],
+        grid: np.ndarray = DEFAULT_GRID,
+    ) -> SpectrumTable:
+        """Builds a table from a ``{name: [(wavelength, value), ...]}`` dict"""
+        grid = np.asarray(grid, dtype=float)
+        values = np.empty((len(spectra), len(grid)))
+        points = {}
+        for k, spectrum in enumerate(spectra.values()):
+            values[k] = resample_spectrum(spectrum, grid)
+            if len(spectrum) == 1:
+                wavelength, value = spectrum[0]
+                points[k] = (float(wavelength), float(value))
+        return cls(list(spectra), grid, values, points)
+
+    @classmethod
+    def from_devices(
+        cls, devices: Iterable, grid: np.ndarray = DEFAULT_GRID
+    ) -> SpectrumTable:
+        """Builds a table from opsin or sensor objects.
+
+        Uses each device's ``exc_spectrum`` if it has one (sensors), otherwise
+        its ``spectrum`` (opsins), keyed by ``name``."""
+        spectra = {}
+        for device in devices:
+            spectra[device.name] = getattr(device, "exc_spectrum", device.spectrum)
+        return cls.from_spectra(spectra, grid)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def index(self, names: str | Sequence[str]) -> int | list[int]:
+        """Row index (or indices) of the given spectrum name(s)"""
+        if isinstance(names, str):
+            return self.names.index(names)
+        return [self.names.index(n) for n in names]
+
+    def __call__(self, wavelengths) -> np.ndarray:
+        """Evaluates every spectrum at ``wavelengths`` (nm).
+
+        Returns shape ``(len(self), *np.shape(wavelengths))``; 0 outside the
+        grid, except for spectra with no data, which stay NaN there too.
+        """
+        wl = np.asarray(wavelengths, dtype=float)
+        pos = (wl.ravel() - self.grid[0]) / self.step
+        outside = (pos < 0) | (pos > len(self.grid) - 1)
+        pos = np.clip(pos, 0, len(self.grid) - 1)
+        lo = np.minimum(pos.astype(int), len(self.grid) - 2)
+        frac = pos - lo
+        out = self.values[:, lo] * (1 - frac) + self.values[:, lo + 1] * frac
+        # the NaN rows of empty spectra stay NaN
+        out[:, outside] = np.where(np.isnan(self.values[:, :1]), np.nan, 0)
+        for row, (wavelength, value) in self.points.items():
+            out[row] = np.where(np.isclose(wl.ravel(), wavelength), value, np.nan)
+        return out.reshape((len(self),) + wl.shape)
+
+    def resample_sources(
+        self, sources: Sequence[Sequence[tuple[float, float]]] | np.ndarray
+    ) -> np.ndarray:
+        """Puts light-source spectra on this table's grid, ``(n_sources, n_grid)``.
+
+        ``sources`` may already be an array sampled on :attr:`grid`, or a list of
+        ``[(wavelength, power), ...]`` lists."""
+        if isinstance(sources, np.ndarray):
+            if sources.shape[-1] != len(self.grid):
+                raise ValueError("source array must be sampled on the table's grid")
+            return np.atleast_2d(sources)
+        out = np.empty((len(sources), len(self.grid)))
+        for k, source in enumerate(sources):
+            out[k] = resample_spectrum(source, self.grid)
+        return out
+
+    def integrate(self, sources, normalize: bool = True) -> np.ndarray:
+        """Integrates every spectrum against every light source.
+
+        Parameters
+        ----------
+        sources : np.ndarray or list
+            Light-source spectra; see :meth:`resample_sources`.
+        normalize : bool, optional
+            If True (default), sources are scaled to unit area, so the result
+            is each spectrum's source-weighted mean value. Otherwise it is
+            ``∫ spectrum(λ) source(λ) dλ``.
+
+        Returns
+        -------
+        np.ndarray
+            ``(len(self), n_sources)`` matrix, from a single matrix multiply.
+        """
+        S = self.resample_sources(sources)
+        if normalize:
+            S = S / (S.sum(axis=1, keepdims=True) * self.step)
+        return self.values @ S.T * self.step
+
+
+def gaussian_sources(
+    centers, fwhm, grid: np.ndarray = DEFAULT_GRID
+) -> np.ndarray:
+    """Gaussian light-source spectra (e.g. LEDs) on ``grid``, ``(n_sources, n_grid)``.
+
+    ``fwhm`` broadcasts against ``centers``; both in nm."""
+    centers, fwhm = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(centers, dtype=float)),
+        np.atleast_1d(np.asarray(fwhm, dtype=float)),
+    )
+    sigma = fwhm / (2 * np.sqrt(2 * np.log(2)))
+    return np.exp(-0.5 * ((grid[None, :] - centers[:, None]) / sigma[:, None]) ** 2)
@@ -0,0 +1,167 @@
+"""Effective 1P/2P irradiance for arrays of spot sizes and beam profiles.
+
+``import matplotlib action spectra opsins updated.py`` converts 2P laser power
+to irradiance with one flat-top spot of 0.1 mm diameter. Here a spot is a
+radially symmetric profile ``g(ρ)``, ``ρ = r / (d / 2)``, scaled to a nominal
+diameter ``d``. Each profile's integrals are computed once, so converting a
+whole (profile x diameter x power) grid is a single broadcast expression:
+
+- 1P effective irradiance is the mean irradiance over the nominal disc,
+  ``P * enclosed / (π R²)``.
+- 2P effective irradiance weights irradiance by itself, as two-photon
+  absorption scales with intensity squared: ``∫I² dA / ∫I dA = P * s2 / R²``.
+
+For a flat-top spot both reduce to the script's ``P / (π R²)``.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Callable, Sequence
+
+import numpy as np
+from attrs import define, field
+from scipy.integrate import quad
+
+
+@define(eq=False)
+class BeamProfile:
+    """Radial intensity profile of a stimulation spot, up to scale.
+
+    Integrals are evaluated once, on construction."""
+
+    name: str
+    shape: Callable[[float], float]
+    """relative intensity at ``ρ = r / (d / 2)``"""
+    rho_max: float = field(default=np.inf, kw_only=True)
+    """where ``shape`` drops to zero, if finite"""
+
+    norm: float = field(init=False)
+    """``∫ g 2πρ dρ``"""
+    enclosed: float = field(init=False)
+    """fraction of power inside the nominal disc ``ρ <= 1``"""
+    s2: float = field(init=False)
+    """``∫ g² 2πρ dρ / norm²``, the 2P weighting in units of ``1/R²``"""
+    peak: float = field(init=False)
+    """``g(0) / norm``, peak irradiance in units of ``P/R²``"""
+
+    def __attrs_post_init__(self):
+        def integral(f, a, b):
+            if np.isinf(b):
+                return quad(f, a, 1)[0] + quad(f, 1, b)[0]
+            return quad(f, a, b, points=[1] if a < 1 < b else None)[0]
+
+        g = self.shape
+        self.norm = integral(lambda rho: g(rho) * 2 * np.pi * rho, 0, self.rho_max)
+        self.enclosed = (
+            integral(lambda rho: g(rho) * 2 * np.pi * rho, 0, min(1, self.rho_max))
+            / self.norm
+        )
+        self.s2 = (
+            integral(lambda rho: g(rho) ** 2 * 2 * np.pi * rho, 0, self.rho_max)
+            / self.norm**2
+        )
+        self.peak = g(0) / self.norm
+
+
+FLAT_TOP = BeamProfile("flat-top", lambda rho: 1.0, rho_max=1)
+"""uniform disc of diameter ``d``, as assumed by the ChroME2f script"""
+
+GAUSSIAN = BeamProfile("gaussian", lambda rho: np.exp(-2 * rho**2))
+"""Gaussian with ``d`` its 1/e² diameter"""
+
+
+@lru_cache(maxsize=None)
+def super_gaussian(order: float) -> BeamProfile:
+    """Super-Gaussian ``exp(-2 ρ^(2 order))`` with ``d`` its 1/e² diameter.
+
+    ``order=1`` is :data:`GAUSSIAN`; large orders approach :data:`FLAT_TOP`.
+    Cached, so asking for the same order again reuses the integrals."""
+    if order == 1:
+        return GAUSSIAN
+    return BeamProfile(
+        f"super-gaussian({order:g})", lambda rho: np.exp(-2 * rho ** (2 * order))
+    )
+
+
+def _profile_factors(profiles: BeamProfile | Sequence[BeamProfile], attr: str):
+    if isinstance(profiles, BeamProfile):
+        return getattr(profiles, attr)
+    return np.array([getattr(p, attr) for p in profiles])
+
+
+def effective_irradiance(
+    power,
+    spot_diameter_mm,
+    profiles: BeamProfile | Sequence[BeamProfile] = FLAT_TOP,
+    photons: int = 1,
+    grid: bool = False,
+) -> np.ndarray:
+    """Converts power (mW) to effective irradiance (mW/mm²).
+
+    Parameters
+    ----------
+    power : array-like
+        Power at the sample (mW).
+    spot_diameter_mm : array-like
+        Nominal spot diameter(s) (mm).
+    profiles : BeamProfile | Sequence[BeamProfile], optional
+        Beam profile(s), by default :data:`FLAT_TOP`.
+    photons : int, optional
+        1 for one-photon (mean over the disc) or 2 for two-photon
+        (intensity-squared weighted) effective irradiance, by default 1.
+    grid : bool, optional
+        If True, return the outer product with shape
+        ``(n_profiles, n_diameters, *power.shape)``; if False (default),
+        broadcast the inputs against each other as usual.
+
+    Returns
+    -------
+    np.ndarray
+    """
+    power = np.asarray(power, dtype=float)
+    radius = np.asarray(spot_diameter_mm, dtype=float) / 2
+    if photons == 1:
+        factor = _profile_factors(profiles, "enclosed") / np.pi
+    elif photons == 2:
+        factor = _profile_factors(profiles, "s2")
+    else:
+        raise ValueError(f"photons must be 1 or 2, not {photons}")
+
+    if grid:
+        factor = np.atleast_1d(factor).reshape((-1, 1) + (1,) * power.ndim)
+        radius = np.atleast_1d(radius).reshape((1, -1) + (1,) * power.ndim)
+    return factor * power / radius**2
+
+
+def peak_irradiance(
+    power, spot_diameter_mm, profiles: BeamProfile | Sequence[BeamProfile] = FLAT_TOP
+) -> np.ndarray:
+    """Irradiance at the spot center (mW/mm²), broadcasting like :func:`effective_irradiance`"""
+    radius = np.asarray(spot_diameter_mm, dtype=float) / 2
+    return _profile_factors(profiles, "peak") * np.asarray(power, dtype=float) / radius**2
+
+
+def geometry_datasets(
+    power,
+    current,
+    spot_diameters_mm: Sequence[float],
+    profiles: Sequence[BeamProfile] = (FLAT_TOP,),
+    photons: int = 2,
+) -> tuple[list[np.ndarray], list[np.ndarray], list[str]]:
+    """Irradiance/current datasets for every (profile, spot diameter).
+
+    The output plugs straight into
+    :func:`transform_search.search_transform_pairs`, giving transform-pair
+    fit statistics for each geometry from the same batched call::
+
+        search_transform_pairs(fam, fam, *geometry_datasets(power_2p, current_2p, d))
+    """
+    irr = effective_irradiance(power, spot_diameters_mm, profiles, photons, grid=True)
+    irradiances, currents, names = [], [], []
+    for i, profile in enumerate(profiles):
+        for j, d in enumerate(np.atleast_1d(spot_diameters_mm)):
+            irradiances.append(irr[i, j])
+            currents.append(np.asarray(current, dtype=float))
+            names.append(f"{profile.name} d={d:g}mm")
+    return irradiances, currents, names
@@ -0,0 +1,55 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from async_readout import DROP_POLICIES, Frame, FrameQueue, run_closed_loop
+
+N_FRAMES = 200
+
+
+@pytest.mark.parametrize("policy", DROP_POLICIES)
+def test_every_frame_is_consumed_or_counted_as_dropped(policy):
+    queue = FrameQueue(maxsize=2, policy=policy)
+    accepted = []
+    consumed = []
+
+    def simulate():
+        for k in range(N_FRAMES):
+            accepted.append(queue.put(Frame(k, float(k), np.zeros(1))))
+
+    def decide(frame):
+        consumed.append(frame.index)
+        time.sleep(1e-4)  # slower than the producer, so the queue fills
+
+    asyncio.run(run_closed_loop(simulate, decide, queue, budget_ms=1.0))
+
+    assert queue.published == sum(accepted)
+    assert len(consumed) + queue.dropped == N_FRAMES
+    assert consumed == sorted(consumed)
+    if policy == "block":
+        assert queue.dropped == 0
+        assert consumed == list(range(N_FRAMES))
+    elif policy == "drop_oldest":
+        assert queue.published == N_FRAMES
+        assert consumed[-1] == N_FRAMES - 1
+
+
+def test_blocked_put_is_rejected_when_the_queue_closes():
+    queue = FrameQueue(maxsize=1, policy="block")
+    assert queue.put(Frame(0, 0.0, np.zeros(1)))
+    results = []
+    producer = threading.Thread(
+        target=lambda: results.append(queue.put(Frame(1, 1.0, np.zeros(1))))
+    )
+    producer.start()
+    deadline = time.monotonic() + 5
+    while not queue._not_full._waiters and time.monotonic() < deadline:
+        time.sleep(1e-3)  # until it blocks on the full queue
+    queue.close()
+    producer.join(timeout=5)
+    assert results == [False]
+    assert queue.published == 1
+    assert len(queue) == 1
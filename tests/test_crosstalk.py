@@ -0,0 +1,30 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from crosstalk import LightSource, crosstalk_matrix
+
+GCAMP = [(400, 0.1), (488, 1.0), (540, 0.2)]
+CHR2 = [(400, 0.5), (470, 1.0), (560, 0.05)]
+
+
+def test_unusable_registry_spectra_warn_by_name():
+    sources = [LightSource("mono593", 593), LightSource("led593", 593, fwhm_nm=20)]
+    with pytest.warns(UserWarning, match="opsins Jaws.*ChR2.*led593") as record:
+        m = crosstalk_matrix({"GCaMP6f": GCAMP}, sources)
+    assert len(record) == 1  # the sensor spectrum is usable
+    assert m.opsin_act[m.opsin_names.index("Jaws")][0] == 1
+    assert np.isnan(m.opsin_act[m.opsin_names.index("Jaws")][1])
+    assert np.isnan(m.opsin_act[m.opsin_names.index("ChR2")]).all()
+
+
+def test_usable_spectra_do_not_warn(tmp_path):
+    sources = [LightSource("imaging", 920, photons=2, fwhm_nm=10), LightSource("stim", 470)]
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        for _ in range(2):  # computed, then from the cache
+            m = crosstalk_matrix(
+                {"GCaMP6f": GCAMP}, sources, {"ChR2": CHR2}, cache_dir=tmp_path
+            )
+    assert np.isfinite(m.opsin_per_sensor).all()
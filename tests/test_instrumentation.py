@@ -0,0 +1,36 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCRIPT = """
+import numpy as np
+from scipy.optimize import curve_fit, least_squares
+
+def line(x, m, k):
+    return m * x + k
+
+x = np.linspace(0, 1, 20)
+curve_fit(line, x, 2 * x + 1)
+least_squares(lambda p: line(x, *p) - (2 * x + 1), [0.0, 0.0])
+"""
+
+
+def test_runner_records_script_fits_despite_env_var(tmp_path):
+    script = tmp_path / "fit script.py"
+    script.write_text(SCRIPT)
+    out = tmp_path / "metrics.json"
+    env = {**os.environ, "SIP_METRICS": str(out)}
+    subprocess.run(
+        [sys.executable, "-m", "instrumentation", str(script)],
+        cwd=ROOT,
+        env=env,
+        check=True,
+        capture_output=True,
+    )
+    records = json.loads(out.read_text())
+    assert [r["model"] for r in records] == ["line", "<lambda>"]
+    assert all(r["metric"] == "fit" and r["nfev"] > 0 for r in records)
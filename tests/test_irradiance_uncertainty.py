@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from irradiance_uncertainty import (
+    _roots,
+    fit_calibration,
+    infer_light_intensity_with_uncertainty,
+)
+
+# calibration data from ``updated irrdiance finder.py``
+DELTAF_OVER_DELTA = np.array([0.054195194, 0.276633455, 0.298183008, 0.337285643, 0.348150156, 0.489879183, 0.782472723, 2.893888292, 4.917773572, 9.78099666])  # fmt: skip
+PHYSIOLOGICAL_RESPONSE = np.array([1.076414424, 1.588873984, 1.759693837, 1.930513691, 2.272153397, 2.613793103, 2.784612957, 3.126252663, 3.638712223, 3.801767537])  # fmt: skip
+N_SAMPLES = 500
+
+
+@pytest.fixture(scope="module")
+def calibration():
+    return fit_calibration(DELTAF_OVER_DELTA, PHYSIOLOGICAL_RESPONSE)
+
+
+@pytest.mark.parametrize("method", ["delta", "monte_carlo"])
+@pytest.mark.parametrize("peaks", [[], 2.5])
+def test_empty_and_scalar_peaks(calibration, method, peaks):
+    est = infer_light_intensity_with_uncertainty(
+        peaks, *calibration, method=method, n_samples=N_SAMPLES, rng=0
+    )
+    shape = np.shape(peaks)
+    for values in (est.value, est.std, est.lower, est.upper):
+        assert values.shape == shape
+    if shape == ():
+        assert est.lower < est.value < est.upper
+
+
+def naive_monte_carlo(peaks, popt, pcov, peak_sigma, branch, seed):
+    """Per-draw roots with NaN-aware statistics, drawing in the same order"""
+    rng = np.random.default_rng(seed)
+    a, b, c = rng.multivariate_normal(popt, pcov, size=N_SAMPLES).T
+    y = peaks[:, None]
+    if peak_sigma is not None:
+        y = y + peak_sigma * rng.standard_normal((len(peaks), N_SAMPLES))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x = _roots(y, a, b, c, branch)
+    lower, upper = np.nanquantile(x, [0.025, 0.975], axis=-1)
+    std = np.nanstd(x, axis=-1, ddof=1)
+    return std, lower, upper, np.mean(~np.isnan(x), axis=-1)
+
+
+@pytest.mark.parametrize(
+    "branch, peak_sigma", [("major", None), ("major", 0.05), ("minor", None)]
+)
+@pytest.mark.parametrize("max_chunk_elements", [2**20, 7 * N_SAMPLES])
+def test_monte_carlo_matches_naive_statistics(
+    calibration, branch, peak_sigma, max_chunk_elements
+):
+    # spans real and complex roots, so some peaks have invalid draws
+    peaks = np.linspace(0.5, 4.5, 40)
+    est = infer_light_intensity_with_uncertainty(
+        peaks, *calibration, method="monte_carlo", peak_sigma=peak_sigma,
+        branch=branch, n_samples=N_SAMPLES, max_chunk_elements=max_chunk_elements,
+        rng=1,
+    )  # fmt: skip
+    std, lower, upper, valid = naive_monte_carlo(
+        peaks, *calibration, peak_sigma, branch, seed=1
+    )
+    assert valid.min() < 1
+    np.testing.assert_allclose(est.valid_fraction, valid)
+    np.testing.assert_allclose(est.std, std, rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(est.lower, lower, rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(est.upper, upper, rtol=1e-9, atol=1e-12)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from opsin_fitting import KineticsFitter, Recording, fit_multistart
+from photocurrent import OPSIN_PARAMS, PhotocurrentEngine, irradiance_to_photon_flux, pulse_train  # fmt: skip
+
+DT = 0.5
+
+
+@pytest.fixture(scope="module")
+def fitter():
+    truth = {**OPSIN_PARAMS["ChR2"], "g0": 2 * OPSIN_PARAMS["ChR2"]["g0"]}
+    phi = pulse_train(irradiance_to_photon_flux([0.5, 5.0], 470), 10, 20, 3, 200, DT)
+    current = PhotocurrentEngine([truth], DT).run([0, 0], phi).current
+    recordings = [Recording(p, c) for p, c in zip(phi, current)]
+    return KineticsFitter(recordings, OPSIN_PARAMS["ChR2"], DT, fit_params=["g0", "Gd1"])
+
+
+def test_pool_matches_in_process_fits(fitter, tmp_path):
+    serial = fit_multistart(fitter, n_starts=3, n_workers=1)
+    pooled = fit_multistart(fitter, n_starts=3, n_workers=2, checkpoint=tmp_path / "c.jsonl")  # fmt: skip
+    assert [r["start"] for r in pooled.fits] == [r["start"] for r in serial.fits]
+    for a, b in zip(serial.fits, pooled.fits):
+        assert a["params"] == pytest.approx(b["params"])
+    g0 = pooled.best_params(OPSIN_PARAMS["ChR2"])["g0"]
+    assert g0 == pytest.approx(2 * OPSIN_PARAMS["ChR2"]["g0"], rel=1e-3)
+
+
+def test_best_params_raises_when_every_start_failed(fitter):
+    result = fit_multistart(fitter, n_starts=2, n_workers=1, method="bogus")
+    assert all(r["params"] is None for r in result.fits)
+    with pytest.raises(ValueError, match="every start failed"):
+        result.best_params(OPSIN_PARAMS["ChR2"])
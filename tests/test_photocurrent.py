@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from scipy.integrate import solve_ivp
+
+from photocurrent import (
+    OPSIN_PARAMS,
+    PhotocurrentEngine,
+    conductance_weights,
+    generator,
+    irradiance_to_photon_flux,
+    is_four_state,
+    pulse_train,
+    steady_state,
+    steady_state_current,
+    voltage_factor,
+)
+
+DT = 0.1
+FOUR_STATE = next(name for name, p in OPSIN_PARAMS.items() if is_four_state(p))
+PUMP = next(name for name, p in OPSIN_PARAMS.items() if not is_four_state(p))
+
+
+@pytest.mark.parametrize("name", list(OPSIN_PARAMS))
+def test_generator_is_a_rate_matrix(name):
+    phi = irradiance_to_photon_flux(np.array([0, 0.1, 1, 10]), 470)
+    Q = generator(OPSIN_PARAMS[name], phi)
+    np.testing.assert_allclose(Q.sum(axis=-2), 0, atol=1e-12)
+    off_diagonal = Q[..., ~np.eye(4, dtype=bool)]
+    assert (off_diagonal >= 0).all()
+    # no light, no activation out of the dark state
+    np.testing.assert_array_equal(Q[0, 1:, 0], 0)
+
+
+def test_voltage_factor():
+    four, pump = OPSIN_PARAMS[FOUR_STATE], OPSIN_PARAMS[PUMP]
+    V = np.array([-90.0, -70.0, -20.0, 30.0])
+    np.testing.assert_allclose(voltage_factor(pump, V), V - pump["E"])
+    dV = V - four["E"]
+    fv = (1 - np.exp(-dV / 43.0)) / (dV / 17.1)
+    np.testing.assert_allclose(voltage_factor(four, V), fv * dV)
+    # continuous through the reversal potential, where fv * (V - E) -> 0
+    assert voltage_factor(four, four["E"]) == 0
+
+
+@pytest.mark.parametrize("name", [FOUR_STATE, PUMP])
+def test_engine_matches_ode_solution(name):
+    params = OPSIN_PARAMS[name]
+    phi = pulse_train(irradiance_to_photon_flux(1.0, 470), 5, 50, 3, 80, DT, 10)
+    result = PhotocurrentEngine([params], DT).run([0], phi, V=-70, return_states=True)
+
+    x = np.array([1.0, 0, 0, 0])
+    expected = np.empty((len(phi), 4))
+    for t, phi_t in enumerate(phi):
+        Q = generator(params, phi_t)
+        sol = solve_ivp(
+            lambda _, y: Q @ y, (0, DT), x, method="DOP853", rtol=1e-13, atol=1e-15
+        )
+        x = expected[t] = sol.y[:, -1]
+    np.testing.assert_allclose(result.states[0], expected, atol=1e-12)
+    current = -params["g0"] * voltage_factor(params, -70) * expected @ conductance_weights(params)  # fmt: skip
+    np.testing.assert_allclose(result.current[0], current, rtol=1e-10, atol=1e-10)
+
+
+def test_propagator_cache_is_bounded():
+    phi = irradiance_to_photon_flux(np.linspace(0.1, 2, 10), 470)[:, None] * np.ones(5)
+    opsin_idx = np.zeros(len(phi), dtype=int)
+    bounded = PhotocurrentEngine([FOUR_STATE], DT, max_propagators=3)
+    expected = PhotocurrentEngine([FOUR_STATE], DT).run(opsin_idx, phi).current
+    for _ in range(2):
+        np.testing.assert_array_equal(bounded.run(opsin_idx, phi).current, expected)
+        assert len(bounded._propagators) == 3
+
+
+@pytest.mark.parametrize("name", list(OPSIN_PARAMS))
+def test_steady_state_matches_long_run(name):
+    params = OPSIN_PARAMS[name]
+    phi = irradiance_to_photon_flux(np.array([0.01, 0.3, 10]), 470)
+    # propagators are exact, so a coarse step reaches equilibrium cheaply;
+    # 2000 s is many times the slowest recovery (1 / Gr = 30 s for ReaChR)
+    long_run = PhotocurrentEngine([params], dt=100.0).run(
+        np.zeros(len(phi), dtype=int), phi[:, None] * np.ones(20_000)
+    )
+    np.testing.assert_allclose(steady_state(params, phi), long_run.final_state, atol=1e-10)
+    np.testing.assert_allclose(
+        steady_state_current([params], phi)[0], long_run.current[:, -1], rtol=1e-8
+    )
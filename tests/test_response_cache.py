@@ -0,0 +1,49 @@
+import numpy as np
+
+from photocurrent import OPSIN_PARAMS, PhotocurrentEngine, irradiance_to_photon_flux
+from response_cache import PulseProtocol, ResponseCache
+
+DT = 0.1
+
+
+def protocol(irradiance):
+    phi = float(irradiance_to_photon_flux(irradiance, 470))
+    return PulseProtocol(phi, 5, 20, 5, 300)
+
+
+def entry_bytes(proto):
+    return proto.trace(DT).nbytes + 4 * 8
+
+
+def test_hits_survive_eviction_within_a_batch():
+    A, B, C = protocol(1), protocol(2), protocol(3)
+    cache = ResponseCache(DT, max_bytes=2 * entry_bytes(A) + 8)
+    (current_a,), _ = cache.run(["ChR2"], [A])
+
+    currents, end_states = cache.run(["ChR2"] * 3, [A, B, C])
+
+    np.testing.assert_array_equal(currents[0], current_a)
+    assert (cache.hits, cache.misses) == (1, 3)
+    assert len(cache) == 2
+    assert end_states.shape == (3, 4)
+
+
+def test_replay_matches_engine_from_bucket_state():
+    cache = ResponseCache(DT)
+    protocols = [protocol(1), protocol(5), protocol(1)]
+    x0 = np.array([[0.9, 0.05, 0.03, 0.02]] * 3)
+    currents, end_states = cache.run(["ChR2", "ChR2", "ChR2"], protocols, x0=x0)
+    replayed, _ = cache.run(["ChR2"], protocols[:1], x0=x0[:1])
+    assert cache.hits == 2
+
+    bucket_state = cache._bucket_state(cache._bucket(x0[0]))
+    engine = PhotocurrentEngine([OPSIN_PARAMS["ChR2"]], DT)
+    direct = engine.run(
+        [0, 0],
+        np.stack([p.trace(DT) for p in protocols[:2]]),
+        x0=np.stack([bucket_state] * 2),
+    )
+    np.testing.assert_allclose(currents[0], direct.current[0])
+    np.testing.assert_allclose(currents[1], direct.current[1])
+    np.testing.assert_allclose(end_states[:2], direct.final_state)
+    np.testing.assert_array_equal(replayed[0], currents[0])
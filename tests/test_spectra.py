@@ -0,0 +1,14 @@
+import numpy as np
+
+from spectra import SpectrumTable
+
+
+def test_missing_spectra_stay_nan_outside_the_grid():
+    grid = np.arange(400.0, 601.0)
+    table = SpectrumTable.from_spectra(
+        {"full": [(450, 0.5), (500, 1.0)], "empty": [], "point": [(593, 1)]}, grid
+    )
+    out = table([350, 475, 593, 700])
+    np.testing.assert_allclose(out[0], [0, 0.75, 0, 0])
+    assert np.isnan(out[1]).all()
+    np.testing.assert_array_equal(out[2], [np.nan, np.nan, 1, np.nan])
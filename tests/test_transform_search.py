@@ -0,0 +1,76 @@
+from itertools import product
+
+import numpy as np
+import pytest
+from scipy.optimize import curve_fit
+
+from transform_search import (
+    FunctionTransforms,
+    PowerTransforms,
+    TransformFamily,
+    search_transform_pairs,
+)
+
+# ChroME2f data from ``import matplotlib action spectra opsins updated.py``,
+# with two more 2P points so the datasets have different lengths
+IRRADIANCES = [
+    np.array([0.133811937, 0.285329021, 0.345634606, 0.161432626, 0.381335054]),
+    np.array([5.05107089, 7.94328048, 12.12580401, 10.2656456, 5.15714371, 3.1, 14.2]),
+]
+CURRENTS = [
+    np.array([0.01831372, 0.469307388, 0.972508906, 1.002046634, 0.750938527]),
+    np.array([0.017954882, 0.225418517, 0.492782039, 0.759697007, 0.998009278, 0.01, 0.9]),
+]
+
+
+def square(x):
+    return x**2
+
+
+FNS_AND_INVS = [(lambda x: x, lambda x: x), (np.log, np.exp), (np.sqrt, square), (square, np.sqrt)]  # fmt: skip
+
+
+def curve_fit_loop(fns_and_invs, irradiances, currents):
+    """The per-pair, per-dataset ``curve_fit`` loop the search replaced"""
+    shape = (len(fns_and_invs), len(fns_and_invs), len(irradiances))
+    slope, percent_resid2, r2 = np.empty(shape), np.empty(shape), np.empty(shape)
+    pairs = product(enumerate(fns_and_invs), enumerate(fns_and_invs))
+    for (a, (f_irr, _)), (b, (f_I, f_I_inv)) in pairs:
+        for d, (irr, I) in enumerate(zip(irradiances, currents)):
+            x, y = f_irr(irr), f_I(I)
+            popt, _, info, _, _ = curve_fit(
+                lambda x, m: x * m, x, y, [1], full_output=True
+            )
+            m = popt[0]
+            I_hat = f_I_inv(m * x)
+            slope[a, b, d] = m
+            percent_resid2[a, b, d] = np.sum(info["fvec"] ** 2) / np.sum(y**2)
+            r2[a, b, d] = 1 - np.sum((I_hat - I) ** 2) / np.sum((I - I.mean()) ** 2)
+    return slope, percent_resid2, r2
+
+
+def test_matches_curve_fit_loop_on_unequal_datasets():
+    transforms = FunctionTransforms(FNS_AND_INVS)
+    with np.errstate(invalid="ignore"):
+        slope, percent_resid2, r2 = curve_fit_loop(FNS_AND_INVS, IRRADIANCES, CURRENTS)
+    result = search_transform_pairs(transforms, transforms, IRRADIANCES, CURRENTS)
+
+    np.testing.assert_allclose(result.slope, slope, rtol=1e-6)
+    np.testing.assert_allclose(result.percent_resid2, percent_resid2, rtol=1e-6)
+    np.testing.assert_allclose(result.r2, r2, rtol=1e-6, atol=1e-8)
+    mean_r2 = r2.mean(axis=-1)
+    np.testing.assert_allclose(result.mean_r2(), mean_r2, rtol=1e-6, atol=1e-8)
+    assert result.best() == np.unravel_index(np.nanargmax(mean_r2), mean_r2.shape)
+
+
+def test_power_transforms_match_function_transforms():
+    powers = PowerTransforms([1, 0, 0.5, 2])
+    functions = FunctionTransforms(FNS_AND_INVS)
+    a = search_transform_pairs(powers, powers, IRRADIANCES, CURRENTS)
+    b = search_transform_pairs(functions, functions, IRRADIANCES, CURRENTS)
+    np.testing.assert_allclose(a.r2, b.r2, rtol=1e-12)
+
+
+def test_transform_family_is_abstract():
+    with pytest.raises(TypeError):
+        TransformFamily()
@@ -0,0 +1,239 @@
+"""Vectorized search over irradiance/current transform pairs.
+
+``import matplotlib action spectra opsins updated.py`` looks for the pair of
+transforms ``(f_irr, f_I)`` under which photocurrent is proportional to
+irradiance, ``f_I(I) = m * f_irr(irr)``. The one-parameter least-squares fit
+has the closed form ``m = Σxy / Σx²``, so instead of one ``curve_fit`` per
+pair and dataset, every transformed dataset is stacked and slopes, residuals
+and R² for all pairs come out of a few NumPy reductions.
+"""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from typing import Callable, Sequence
+
+import numpy as np
+from attrs import define, field
+
+
+@define(eq=False)
+class TransformFamily(ABC):
+    """Base class for a family of invertible transforms, evaluated all at once"""
+
+    names: list[str] = field(init=False)
+
+    @abstractmethod
+    def forward(self, x: np.ndarray) -> np.ndarray:
+        """Returns every transform of ``x``, shape ``(len(self), *x.shape)``"""
+
+    @abstractmethod
+    def inverse(self, y: np.ndarray) -> np.ndarray:
+        """Inverts ``y[k]`` with transform ``k``; ``y.shape[0] == len(self)``"""
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, k: int) -> tuple[Callable, Callable]:
+        """Returns transform ``k`` and its inverse as standalone functions"""
+
+        def f(x):
+            return self.forward(np.asarray(x, dtype=float))[k]
+
+        def f_inv(y):
+            y = np.asarray(y, dtype=float)
+            return self.inverse(np.broadcast_to(y, (len(self),) + y.shape))[k]
+
+        f.__name__ = self.names[k]
+        f_inv.__name__ = f"inverse of {self.names[k]}"
+        return f, f_inv
+
+
+@define(eq=False)
+class FunctionTransforms(TransformFamily):
+    """An arbitrary list of ``(f, f_inv)`` pairs, applied one by one.
+
+    Only loops over the (few) functions, not over pairs or datasets.
+    """
+
+    fns_and_invs: Sequence[tuple[Callable, Callable]]
+
+    def __attrs_post_init__(self):
+        self.names = [f.__name__ for f, _ in self.fns_and_invs]
+
+    def forward(self, x):
+        return np.stack([f(x) for f, _ in self.fns_and_invs])
+
+    def inverse(self, y):
+        return np.stack([f_inv(y_k) for (_, f_inv), y_k in zip(self.fns_and_invs, y)])
+
+
+@define(eq=False)
+class PowerTransforms(TransformFamily):
+    """``x ** lam`` for each ``lam`` in a grid, with ``log`` standing in for 0.
+
+    ``lambdas=[1, 0, 0.5, 2]`` reproduces the script's identity/log/sqrt/square.
+    """
+
+    lambdas: np.ndarray = field(converter=lambda a: np.asarray(a, dtype=float))
+
+    def __attrs_post_init__(self):
+        self.names = [f"x**{lam:g}" if lam != 0 else "log" for lam in self.lambdas]
+
+    def _lam(self, ndim):
+        return self.lambdas.reshape((-1,) + (1,) * ndim)
+
+    def forward(self, x):
+        x = np.asarray(x, dtype=float)
+        lam = self._lam(x.ndim)
+        safe_lam = np.where(lam == 0, 1, lam)
+        return np.where(lam == 0, np.log(x), x**safe_lam)
+
+    def inverse(self, y):
+        lam = self._lam(y.ndim - 1)
+        safe_lam = np.where(lam == 0, 1, lam)
+        return np.where(lam == 0, np.exp(y), y ** (1 / safe_lam))
+
+
+@define(eq=False)
+class BoxCoxTransforms(PowerTransforms):
+    """Box-Cox transforms ``(x ** lam - 1) / lam`` (``log`` at 0) over a grid"""
+
+    def __attrs_post_init__(self):
+        self.names = [f"boxcox({lam:g})" for lam in self.lambdas]
+
+    def forward(self, x):
+        x = np.asarray(x, dtype=float)
+        lam = self._lam(x.ndim)
+        safe_lam = np.where(lam == 0, 1, lam)
+        return np.where(lam == 0, np.log(x), (x**safe_lam - 1) / safe_lam)
+
+    def inverse(self, y):
+        lam = self._lam(y.ndim - 1)
+        safe_lam = np.where(lam == 0, 1, lam)
+        return np.where(lam == 0, np.exp(y), (safe_lam * y + 1) ** (1 / safe_lam))
+
+
+@define(eq=False)
+class TransformSearchResult:
+    """Fit statistics for every (irradiance transform, current transform, dataset).
+
+    All arrays have shape ``(len(irr_transforms), len(I_transforms), n_datasets)``.
+    """
+
+    irr_transforms: TransformFamily
+    I_transforms: TransformFamily
+    dataset_names: list[str]
+    slope: np.ndarray
+    """closed-form least-squares slope ``m`` in transformed space"""
+    percent_resid2: np.ndarray
+    """residual sum of squares over ``Σ f_I(I)²``, as in the script's ``opt``"""
+    r2: np.ndarray
+    """R² of ``f_I_inv(m * f_irr(irr))`` against the untransformed current"""
+
+    def mean_r2(self, datasets: Sequence[str] | None = None) -> np.ndarray:
+        """Mean R² over the given datasets (default all), shape ``(n_irr, n_I)``.
+
+        NaN if any of the datasets can't be fit under a pair."""
+        idx = (
+            slice(None)
+            if datasets is None
+            else [self.dataset_names.index(d) for d in datasets]
+        )
+        return self.r2[..., idx].mean(axis=-1)
+
+    def best(self, datasets: Sequence[str] | None = None) -> tuple[int, int]:
+        """Indices ``(i_irr, i_I)`` of the pair with the highest :meth:`mean_r2`"""
+        mean_r2 = self.mean_r2(datasets)
+        if np.all(np.isnan(mean_r2)):
+            raise ValueError("no transform pair gives a valid fit")
+        i_irr, i_I = np.unravel_index(np.nanargmax(mean_r2), mean_r2.shape)
+        return int(i_irr), int(i_I)
+
+
+def _stack_datasets(arrays: Sequence[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    """Pads 1D datasets of different lengths to one ``(n_datasets, n_max)`` array"""
+    n_max = max(len(a) for a in arrays)
+    stacked = np.ones((len(arrays), n_max))
+    mask = np.zeros((len(arrays), n_max), dtype=bool)
+    for k, a in enumerate(arrays):
+        stacked[k, : len(a)] = a
+        mask[k, : len(a)] = True
+    return stacked, mask
+
+
+def search_transform_pairs(
+    irr_transforms: TransformFamily,
+    I_transforms: TransformFamily,
+    irradiances: Sequence[np.ndarray],
+    currents: Sequence[np.ndarray],
+    dataset_names: Sequence[str] | None = None,
+    max_elements: int = 2**24,
+) -> TransformSearchResult:
+    """Fits ``f_I(I) = m * f_irr(irr)`` for every transform pair and dataset.
+
+    Parameters
+    ----------
+    irr_transforms, I_transforms : TransformFamily
+        Candidate transforms for irradiance and for current.
+    irradiances, currents : Sequence[np.ndarray]
+        One irradiance and one current array per dataset (e.g. 1P and 2P
+        recordings of each opsin in the panel). Lengths may differ between
+        datasets.
+    dataset_names : Sequence[str], optional
+        Labels for the datasets, by default ``"0"``, ``"1"``, ...
+    max_elements : int, optional
+        Bounds the size of the ``(irr transform, I transform, dataset, sample)``
+        array used for R², by processing irradiance transforms in chunks.
+
+    Returns
+    -------
+    TransformSearchResult
+    """
+    if len(irradiances) != len(currents):
+        raise ValueError("need one current array per irradiance array")
+    if dataset_names is None:
+        dataset_names = [str(k) for k in range(len(irradiances))]
+    irr, mask = _stack_datasets(irradiances)
+    I, _ = _stack_datasets(currents)
+
+    with np.errstate(all="ignore"):
+        X = irr_transforms.forward(irr) * mask  # (Tx, D, n)
+        Y = I_transforms.forward(I) * mask  # (Ty, D, n)
+        # NaN/inf from invalid transforms must not leak in via padding
+        X[:, ~mask] = 0
+        Y[:, ~mask] = 0
+
+        Sxx = np.einsum("adn,adn->ad", X, X)
+        Syy = np.einsum("bdn,bdn->bd", Y, Y)
+        Sxy = np.einsum("adn,bdn->abd", X, Y)
+        slope = Sxy / Sxx[:, None]
+        percent_resid2 = (Syy[None] - slope * Sxy) / Syy[None]
+
+        I_mean = np.sum(I * mask, -1, keepdims=True) / mask.sum(-1, keepdims=True)
+        I_centered = np.where(mask, I - I_mean, 0)
+        SST = np.sum(I_centered**2, axis=-1)  # (D,)
+
+        n_irr, n_I = len(irr_transforms), len(I_transforms)
+        chunk = max(1, max_elements // max(1, n_I * X[0].size))
+        r2 = np.empty_like(slope)
+        for start in range(0, n_irr, chunk):
+            stop = min(start + chunk, n_irr)
+            # (Ty, Tx_chunk, D, n) so the current transforms' axis leads
+            Z = slope[start:stop].transpose(1, 0, 2)[..., None] * X[None, start:stop]
+            I_hat = I_transforms.inverse(Z)
+            SSE = np.sum(np.where(mask, I_hat - I, 0) ** 2, axis=-1)
+            r2[start:stop] = (1 - SSE / SST).transpose(1, 0, 2)
+
+    invalid = ~np.isfinite(X).all(axis=-1)[:, None] | ~np.isfinite(Y).all(axis=-1)[None]
+    for arr in (slope, percent_resid2, r2):
+        arr[invalid | ~np.isfinite(arr)] = np.nan
+
+    return TransformSearchResult(
+        irr_transforms=irr_transforms,
+        I_transforms=I_transforms,
+        dataset_names=list(dataset_names),
+        slope=slope,
+        percent_resid2=percent_resid2,
+        r2=r2,
+    )